@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+
+# region Settings
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 4000))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("CONTEXT_SUMMARY_TOKEN_BUDGET", 600))
+SUMMARY_LINE_CHARS = 200
+CHARS_PER_TOKEN = 4
+MAX_CACHED_SUMMARIES = 256
+# endregion
+
+# session_id -> {"last_id": newest message folded into the summary, "lines": [...]}
+_summaries = OrderedDict()
+_summaries_lock = threading.Lock()
+
+def estimate_tokens(text):
+    # Local estimate (~4 characters per token for English), plus per-message overhead
+    return len(text or "") // CHARS_PER_TOKEN + 4
+
+def get_message_text(message):
+    # Earlier attachments are referenced by name instead of being uploaded again
+    text = message.get("content") or ""
+    references = [
+        f"[Attached file: {file.get('name')} ({file.get('mimetype')})]"
+        for file in message.get("files") or []
+    ]
+    return "\n".join([text, *references]) if references else text
+
+def _get_summary_line(message):
+    text = " ".join(get_message_text(message).split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS] + "…"
+    return f"{message.get('role')}: {text}"
+
+def _trim_summary(lines):
+    # Oldest lines go first once the summary outgrows its budget
+    while lines and estimate_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return lines
+
+def get_rolling_summary(session_id, older_messages):
+    # Extractive summary of turns that fell out of the window, extended incrementally
+    if not older_messages:
+        return ""
+    newest_id = older_messages[-1].get("id")
+    with _summaries_lock:
+        cached = _summaries.get(session_id)
+        if cached is not None and newest_id is not None and cached["last_id"] is not None and cached["last_id"] <= newest_id:
+            new_messages = [m for m in older_messages if (m.get("id") or 0) > cached["last_id"]]
+            lines = cached["lines"] + [_get_summary_line(m) for m in new_messages]
+        else:
+            lines = [_get_summary_line(m) for m in older_messages]
+        lines = _trim_summary(lines)
+        _summaries[session_id] = {"last_id": newest_id, "lines": lines}
+        _summaries.move_to_end(session_id)
+        while len(_summaries) > MAX_CACHED_SUMMARIES:
+            _summaries.popitem(last=False)
+    return "\n".join(lines)
+
+def build_context_messages(session_id, history, user_message, token_budget=CONTEXT_TOKEN_BUDGET):
+    # Newest turns first until the budget is spent; older turns are folded into a summary.
+    # user_message goes last; its content is a list of parts, or plain text for an assistant
+    # message being continued.
+    content = user_message.get("content")
+    if isinstance(content, str):
+        used_tokens = estimate_tokens(content)
+    else:
+        used_tokens = sum(
+            estimate_tokens(part.get("text")) for part in content or []
+            if part.get("type") == "text"
+        )
+    window = []
+    cutoff = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        text = get_message_text(message)
+        if not text:
+            # An answer that failed before its first token
+            cutoff = index
+            continue
+        tokens = estimate_tokens(text)
+        if used_tokens + tokens > token_budget:
+            break
+        window.append({"role": message.get("role"), "content": text})
+        used_tokens += tokens
+        cutoff = index
+    window.reverse()
+
+    messages = []
+    summary = get_rolling_summary(session_id, history[:cutoff])
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier part of this conversation:\n{summary}"
+        })
+    return messages + window + [user_message]
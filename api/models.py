@@ -0,0 +1,7 @@
+import os
+
+# Kept apart from the router, so showing the configuration does not import the HTTP client
+# region Settings (overridable through environment variables)
+MODELS = [model.strip() for model in os.environ.get("OPENROUTER_MODELS", "openai/gpt-4.1").split(",") if model.strip()]
+ROUTING_MODE = os.environ.get("MODEL_ROUTING_MODE", "fallback")  # "fallback", "latency" or "race"
+# endregion
@@ -0,0 +1,98 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from monitoring.metrics import get_counter, get_histogram
+
+# region Settings (overridable through environment variables)
+BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
+CONNECT_TIMEOUT = float(os.environ.get("OPENROUTER_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("OPENROUTER_READ_TIMEOUT", 30))
+MAX_RETRIES = int(os.environ.get("OPENROUTER_MAX_RETRIES", 3))
+BACKOFF_BASE = float(os.environ.get("OPENROUTER_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("OPENROUTER_BACKOFF_MAX", 8))
+RETRY_AFTER_MAX = float(os.environ.get("OPENROUTER_RETRY_AFTER_MAX", 60))
+POOL_SIZE = int(os.environ.get("OPENROUTER_POOL_SIZE", 10))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# endregion
+
+_request_seconds = get_histogram("openrouter_request_seconds", "Time until the response headers arrived, retries included")
+_retries = get_counter("openrouter_retries_total", "Chat-completion attempts retried after a connection error, 429 or 5xx")
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    # One pooled keep-alive session per process, shared by every browser session
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def get_retry_delay(attempt, response=None):
+    # Retry-After wins when the server sends one, otherwise exponential backoff with full jitter.
+    # Returns None when the server asks for a longer wait than RETRY_AFTER_MAX: the caller gives up.
+    retry_after = get_retry_after(response) if response is not None else None
+    if retry_after is not None:
+        return retry_after if retry_after <= RETRY_AFTER_MAX else None
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def get_retry_after(response):
+    # Seconds requested by the Retry-After header, given either as seconds or as an HTTP date
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def post_chat_completion(headers, data, url=None, max_retries=None):
+    # Returns the streaming response, retrying connection failures, 429 and 5xx.
+    # Only failures to connect are retried: after a read timeout the request may already be billed.
+    # The last failed response is returned as-is so callers can show its error, and so is a
+    # 429 or 503 whose Retry-After asks for longer than RETRY_AFTER_MAX.
+    # max_retries defaults to MAX_RETRIES; the model router passes 0 when another model can take over.
+    if max_retries is None:
+        max_retries = MAX_RETRIES
+    with _request_seconds.time():
+        return _post_with_retries(get_http_session(), headers, data, url, max_retries)
+
+def _post_with_retries(session, headers, data, url, max_retries):
+    for attempt in range(max_retries + 1):
+        is_last_attempt = attempt == max_retries
+        try:
+            response = session.post(
+                url=url or BASE_URL,
+                headers=headers,
+                data=data,
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+            )
+        except (requests.ConnectTimeout, requests.ConnectionError):
+            if is_last_attempt:
+                raise
+            _retries.inc()
+            time.sleep(get_retry_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUS_CODES and not is_last_attempt:
+            delay = get_retry_delay(attempt, response)
+            if delay is None:
+                return response
+            response.close()
+            _retries.inc()
+            time.sleep(delay)
+            continue
+        return response
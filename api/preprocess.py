@@ -0,0 +1,138 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # PDF page limiting and text extraction are skipped without pypdf
+    PdfReader = PdfWriter = None
+
+# region Settings
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 2048))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 85))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 0))  # 0 keeps every page
+PDF_EXTRACT_TEXT = os.environ.get("PDF_EXTRACT_TEXT", "false").lower() == "true"
+THUMBNAIL_MAX_DIMENSION = int(os.environ.get("THUMBNAIL_MAX_DIMENSION", 512))
+MAX_WORKERS = 4
+MAX_CACHED_ATTACHMENTS = 64
+MAX_CACHED_THUMBNAILS = 256
+# endregion
+
+ORIENTATION_TAG = 0x0112  # EXIF Orientation
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_thumbnails = OrderedDict()
+_thumbnails_lock = threading.Lock()
+
+def _downscale_image(data, mimetype):
+    from PIL import Image, ImageOps  # Pillow ships with Streamlit
+
+    with Image.open(io.BytesIO(data)) as original:
+        original.load()
+        # Re-encoding drops the EXIF orientation tag, so the rotation is applied to the pixels
+        rotated = original.getexif().get(ORIENTATION_TAG, 1) != 1
+        image = ImageOps.exif_transpose(original)
+        if max(image.size) > IMAGE_MAX_DIMENSION:
+            image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+        output = io.BytesIO()
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha:
+            image.save(output, format="PNG", optimize=True)
+            output_mimetype = "image/png"
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+            output_mimetype = "image/jpeg"
+    processed = output.getvalue()
+    # Recompression can lose to an already well-compressed original, unless it has to be rotated
+    if len(processed) >= len(data) and not rotated:
+        return {"data": data, "mimetype": mimetype}
+    return {"data": processed, "mimetype": output_mimetype}
+
+def _process_pdf(data, mimetype):
+    if PdfReader is None or (not PDF_EXTRACT_TEXT and not PDF_MAX_PAGES):
+        return {"data": data, "mimetype": mimetype}
+    reader = PdfReader(io.BytesIO(data))
+    pages = reader.pages[:PDF_MAX_PAGES] if PDF_MAX_PAGES else reader.pages
+    if PDF_EXTRACT_TEXT:
+        return {"text": "\n\n".join(page.extract_text() or "" for page in pages), "mimetype": mimetype}
+    if len(pages) == len(reader.pages):
+        return {"data": data, "mimetype": mimetype}
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(page)
+    output = io.BytesIO()
+    writer.write(output)
+    return {"data": output.getvalue(), "mimetype": mimetype}
+
+def preprocess_attachment(name, mimetype, data):
+    # Returns {"name", "mimetype", and "data" (bytes) or "text"}, cached by content hash
+    key = (hashlib.sha256(data).hexdigest(), mimetype)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return {**cached, "name": name}
+
+    try:
+        if mimetype and mimetype.startswith("image/"):
+            processed = _downscale_image(data, mimetype)
+        elif mimetype == "application/pdf":
+            processed = _process_pdf(data, mimetype)
+        else:
+            processed = {"data": data, "mimetype": mimetype}
+    except Exception:
+        # A file the local tools cannot read is still sent as uploaded
+        processed = {"data": data, "mimetype": mimetype}
+
+    with _cache_lock:
+        _cache[key] = processed
+        while len(_cache) > MAX_CACHED_ATTACHMENTS:
+            _cache.popitem(last=False)
+    return {**processed, "name": name}
+
+def preprocess_attachments(attachments):
+    # attachments: list of (name, mimetype, data); processed in a thread pool when there are several
+    if len(attachments) <= 1:
+        return [preprocess_attachment(*attachment) for attachment in attachments]
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(attachments))) as executor:
+        return list(executor.map(lambda attachment: preprocess_attachment(*attachment), attachments))
+
+def _make_thumbnail(data):
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        if max(original.size) <= THUMBNAIL_MAX_DIMENSION:
+            return None
+        original.draft("RGB", (THUMBNAIL_MAX_DIMENSION, THUMBNAIL_MAX_DIMENSION))  # JPEG decodes at a reduced scale
+        image = ImageOps.exif_transpose(original)  # The thumbnail has no EXIF tag to rotate it by
+        image.thumbnail((THUMBNAIL_MAX_DIMENSION, THUMBNAIL_MAX_DIMENSION), Image.LANCZOS)
+        output = io.BytesIO()
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha:
+            image.save(output, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+    return output.getvalue()
+
+def get_thumbnail(digest, load_data):
+    # Thumbnail bytes for an image larger than THUMBNAIL_MAX_DIMENSION, or None when it is
+    # small enough to show as is. Cached by hash, so load_data() only runs on a miss.
+    with _thumbnails_lock:
+        if digest in _thumbnails:
+            _thumbnails.move_to_end(digest)
+            return _thumbnails[digest]
+
+    try:
+        thumbnail = _make_thumbnail(load_data())
+    except Exception:
+        thumbnail = None  # An image Pillow cannot read is shown as is
+
+    with _thumbnails_lock:
+        _thumbnails[digest] = thumbnail
+        while len(_thumbnails) > MAX_CACHED_THUMBNAILS:
+            _thumbnails.popitem(last=False)
+    return thumbnail
@@ -0,0 +1,72 @@
+import base64
+import json
+from monitoring.metrics import METRICS_ENABLED, SIZE_BUCKETS, get_histogram
+
+# Raw bytes base64-encoded per step; a multiple of 3 so chunks concatenate without padding
+ENCODE_CHUNK_SIZE = 48 * 1024
+# Small JSON pieces are coalesced until the outgoing chunk reaches this size
+FLUSH_SIZE = 64 * 1024
+
+_body_bytes = get_histogram("openrouter_request_body_bytes", "Bytes sent per chat-completion request body", buckets=SIZE_BUCKETS)
+
+class Base64DataUri:
+    # Placeholder for file bytes inside a payload, written as a data: URI while streaming
+    __slots__ = ("mimetype", "data")
+
+    def __init__(self, mimetype, data):
+        self.mimetype = mimetype
+        self.data = data
+
+def _iter_json_pieces(value):
+    if isinstance(value, Base64DataUri):
+        yield json.dumps(f"data:{value.mimetype};base64,")[:-1].encode()
+        view = memoryview(value.data)
+        for start in range(0, len(view), ENCODE_CHUNK_SIZE):
+            yield base64.b64encode(view[start:start + ENCODE_CHUNK_SIZE])
+        view.release()
+        yield b'"'
+    elif isinstance(value, dict):
+        yield b"{"
+        for index, (key, item) in enumerate(value.items()):
+            yield (", " if index else "").encode() + json.dumps(str(key)).encode() + b": "
+            yield from _iter_json_pieces(item)
+        yield b"}"
+    elif isinstance(value, (list, tuple)):
+        yield b"["
+        for index, item in enumerate(value):
+            if index:
+                yield b", "
+            yield from _iter_json_pieces(item)
+        yield b"]"
+    else:
+        yield json.dumps(value).encode()
+
+def encode_json_stream(payload):
+    # Yields the JSON encoding of payload in bounded chunks; Base64DataUri values are
+    # encoded piece by piece, so no full base64 or JSON string is ever held in memory
+    buffer = bytearray()
+    for piece in _iter_json_pieces(payload):
+        buffer += piece
+        if len(buffer) >= FLUSH_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+class JsonStreamBody:
+    # Re-iterable request body: requests sends it with chunked transfer encoding,
+    # and every retry attempt gets a fresh generator
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __iter__(self):
+        if METRICS_ENABLED:
+            return _count_bytes(encode_json_stream(self.payload))
+        return encode_json_stream(self.payload)
+
+def _count_bytes(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    _body_bytes.observe(size)
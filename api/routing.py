@@ -0,0 +1,231 @@
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+import requests
+from api.openrouter import RETRY_STATUS_CODES, READ_TIMEOUT, post_chat_completion
+from api.models import MODELS, ROUTING_MODE
+from api.streaming import iter_response_deltas
+from db.model_stats import load_model_stats, save_model_stats
+from monitoring.metrics import get_counter, get_histogram
+
+# region Settings (overridable through environment variables)
+RACE_WIDTH = int(os.environ.get("MODEL_RACE_WIDTH", 2))               # Models queried at once in race mode
+STATS_WINDOW = int(os.environ.get("MODEL_STATS_WINDOW", 100))         # Recent requests kept per model
+ERROR_RATE_PENALTY = float(os.environ.get("MODEL_ERROR_RATE_PENALTY", 4))
+# endregion
+
+_fallbacks = get_counter("model_fallbacks_total", "Requests handed to the next model after a connection error, 429 or 5xx")
+
+class ModelStats:
+    # Sliding window of one model's recent requests
+    def __init__(self, latencies=(), outcomes=()):
+        self.latencies = deque(latencies, maxlen=STATS_WINDOW)  # Seconds from sending to the first delta
+        self.outcomes = deque(outcomes, maxlen=STATS_WINDOW)    # 1 for a completed stream, 0 for a failure
+
+    def get_latency_quantile(self, quantile):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(quantile * len(ordered)) - 1)]
+
+    def get_error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def get_score(self):
+        # Lower is better: the mean of p50 and p95, inflated by the error rate.
+        # Models without any sample score 0, so each one gets tried early on.
+        if not self.outcomes and not self.latencies:
+            return 0.0
+        if self.latencies:
+            latency = (self.get_latency_quantile(0.5) + self.get_latency_quantile(0.95)) / 2
+        else:
+            latency = READ_TIMEOUT  # Never answered: as slow as a timeout
+        return latency * (1 + ERROR_RATE_PENALTY * self.get_error_rate())
+
+    def get_snapshot(self):
+        return {
+            "p50": self.get_latency_quantile(0.5),
+            "p95": self.get_latency_quantile(0.95),
+            "error_rate": self.get_error_rate(),
+            "requests": len(self.outcomes)
+        }
+
+_stats = None
+_stats_lock = threading.Lock()
+
+def _get_stats(model):
+    # Called with _stats_lock held; samples persisted by earlier processes are loaded on first use
+    global _stats
+    if _stats is None:
+        _stats = {name: ModelStats(latencies, outcomes) for name, (latencies, outcomes) in load_model_stats().items()}
+    if model not in _stats:
+        _stats[model] = ModelStats()
+    return _stats[model]
+
+def record_latency(model, seconds):
+    with _stats_lock:
+        _get_stats(model).latencies.append(seconds)
+    get_histogram("model_time_to_first_token_seconds", "Time from sending a request to its first delta", {"model": model}).observe(seconds)
+
+def record_outcome(model, succeeded):
+    # Outcomes are rarer than reads, so the window is written through to the local DB on each one
+    with _stats_lock:
+        stats = _get_stats(model)
+        stats.outcomes.append(1 if succeeded else 0)
+        latencies, outcomes = list(stats.latencies), list(stats.outcomes)
+    save_model_stats(model, latencies, outcomes)
+
+def get_model_stats(models=None):
+    # {model: {p50, p95, error_rate, requests}} for the configured models
+    with _stats_lock:
+        return {model: _get_stats(model).get_snapshot() for model in models or MODELS}
+
+def get_ranked_models(models=None, mode=None):
+    # Configured order for fallback mode, best score first otherwise (ties keep the configured order)
+    models = list(models or MODELS)
+    if (mode or ROUTING_MODE) == "fallback":
+        return models
+    with _stats_lock:
+        scores = {model: _get_stats(model).get_score() for model in models}
+    return sorted(models, key=lambda model: scores[model])
+
+class Route:
+    # The request that won: response is the HTTP response, deltas its content iterator
+    def __init__(self, model, response, deltas=None):
+        self.model = model
+        self.response = response
+        self.deltas = deltas
+
+def _track_deltas(model, deltas, sent_at):
+    # Records time to first delta and whether the stream completed
+    first_delta = True
+    try:
+        for delta in deltas:
+            if first_delta:
+                record_latency(model, time.perf_counter() - sent_at)
+                first_delta = False
+            yield delta
+    except Exception:
+        record_outcome(model, False)
+        raise
+    record_outcome(model, True)
+
+def _send(model, headers, build_data, url, max_retries):
+    # Returns a Route; deltas is None unless the response is a 200
+    sent_at = time.perf_counter()
+    try:
+        response = post_chat_completion(headers, build_data(model), url=url, max_retries=max_retries)
+    except requests.RequestException:
+        record_outcome(model, False)
+        raise
+    if response.status_code != 200:
+        if response.status_code in RETRY_STATUS_CODES:
+            record_outcome(model, False)
+        return Route(model, response)
+    return Route(model, response, _track_deltas(model, iter_response_deltas(response), sent_at))
+
+def _is_rejected(route):
+    # An error response the other models would give as well (bad request, auth, ...)
+    return route.deltas is None and route.response.status_code not in RETRY_STATUS_CODES
+
+def _raise(error):
+    raise error
+    yield
+
+def _fall_back(models, headers, build_data, url):
+    # Tries each model in turn; only the last one gets the usual retries with backoff
+    for index, model in enumerate(models):
+        is_last_model = index == len(models) - 1
+        try:
+            route = _send(model, headers, build_data, url, None if is_last_model else 0)
+        except requests.RequestException:
+            if is_last_model:
+                raise
+            _fallbacks.inc()
+            continue
+        if route.deltas is not None or is_last_model or _is_rejected(route):
+            return route
+        route.response.close()
+        _fallbacks.inc()
+
+def _race(models, headers, build_data, url):
+    # Sends to every model at once and keeps the first one that streams a delta.
+    # Returns (winner, None), or (None, failure) where failure is the last Route that failed
+    # (an error response, or a stream that broke before its first delta) or the exception raised.
+    results = queue.Queue()
+    decided = threading.Event()
+    decided_lock = threading.Lock()
+
+    def run(model):
+        try:
+            route = _send(model, headers, build_data, url, 0)
+        except requests.RequestException as ex:
+            results.put((None, ex))
+            return
+        error = None
+        if route.deltas is not None:
+            try:
+                first_delta = next(route.deltas)
+                route.deltas = itertools.chain([first_delta], route.deltas)
+            except StopIteration:
+                route.deltas = iter(())  # An empty answer still counts as one
+            except Exception as ex:
+                error = ex
+                route.deltas = _raise(ex)  # Reported by the generation if every model fails
+        with decided_lock:
+            if not decided.is_set():
+                results.put((route, error))
+                return
+        route.response.close()  # Lost the race
+
+    for model in models:
+        threading.Thread(target=run, args=(model,), name=f"race-{model}", daemon=True).start()
+
+    failure = None
+    for _ in models:
+        route, error = results.get()
+        if route is not None and (error is None and route.deltas is not None or _is_rejected(route)):
+            with decided_lock:
+                decided.set()
+                # Finishers queued before the decision are closed here, later ones close themselves
+                while not results.empty():
+                    other, _ = results.get_nowait()
+                    if other is not None:
+                        other.response.close()
+            return (route, None) if route.deltas is not None else (None, route)
+        if isinstance(failure, Route):
+            failure.response.close()
+        failure = route if route is not None else error
+    return None, failure
+
+def route_chat_completion(headers, build_data, url=None, models=None, mode=None):
+    # Sends the chat completion to the configured models according to the routing mode:
+    #   fallback: configured order, moving on after a connection error, 429 or 5xx
+    #   latency:  best p50/p95 and error rate first, falling back the same way
+    #   race:     the best RACE_WIDTH models at once, streaming whichever sends the first delta;
+    #             the rest are tried in turn if all of them fail
+    # build_data(model) returns the request body for a model. Returns a Route whose response
+    # is a 200 with its deltas, or the last error response; the last connection error is raised.
+    mode = mode or ROUTING_MODE
+    ranked = get_ranked_models(models, mode)
+    if mode != "race" or len(ranked) < 2:
+        return _fall_back(ranked, headers, build_data, url)
+
+    racers, rest = ranked[:RACE_WIDTH], ranked[RACE_WIDTH:]
+    route, failure = _race(racers, headers, build_data, url)
+    if route is not None:
+        return route
+    if rest and not (isinstance(failure, Route) and _is_rejected(failure)):
+        if isinstance(failure, Route):
+            failure.response.close()
+        _fallbacks.inc()
+        return _fall_back(rest, headers, build_data, url)
+    if isinstance(failure, Route):
+        return failure
+    raise failure
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import deque
+from monitoring.metrics import get_gauge, get_histogram
+
+# region Settings (overridable through environment variables)
+MAX_CONCURRENT_GENERATIONS = int(os.environ.get("MAX_CONCURRENT_GENERATIONS", 8))  # Outbound streams per process
+MAX_QUEUE_WAIT = float(os.environ.get("GENERATION_MAX_QUEUE_WAIT", 120))          # Seconds before a queued message gives up
+# endregion
+
+_queue_depth = get_gauge("generation_queue_depth", "Messages waiting for a generation slot")
+_active_generations = get_gauge("generation_active", "Generations holding a slot")
+_queue_wait_seconds = get_histogram("generation_queue_wait_seconds", "Time a message waited for its generation slot")
+
+class Ticket:
+    # One message's place in the queue; holds a slot from grant until release
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self.released = False
+
+class GenerationScheduler:
+    # Process-wide gate for outbound generations: at most max_concurrent hold a slot,
+    # slots go out in arrival order, and a session runs one generation at a time, so
+    # its messages are answered (and saved) in the order they were sent.
+    # A message blocked only by its own session does not hold up other sessions.
+
+    def __init__(self, max_concurrent=None):
+        self.max_concurrent = MAX_CONCURRENT_GENERATIONS if max_concurrent is None else max_concurrent
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._running_sessions = set()
+        self._active = 0
+
+    def submit(self, session_id):
+        ticket = Ticket(session_id)
+        with self._condition:
+            self._waiting.append(ticket)
+            _queue_depth.inc()
+            self._dispatch()
+        return ticket
+
+    def _dispatch(self):
+        # Called with the condition held
+        granted = False
+        for ticket in list(self._waiting):
+            if self._active >= self.max_concurrent:
+                break
+            if ticket.session_id in self._running_sessions:
+                continue
+            self._waiting.remove(ticket)
+            self._running_sessions.add(ticket.session_id)
+            self._active += 1
+            ticket.granted = True
+            granted = True
+            _queue_depth.dec()
+            _active_generations.inc()
+            _queue_wait_seconds.observe(time.perf_counter() - ticket.enqueued_at)
+        if granted:
+            self._condition.notify_all()
+
+    def wait(self, ticket, timeout=None):
+        # True once the ticket holds a slot, False if the timeout passed first
+        with self._condition:
+            return self._condition.wait_for(lambda: ticket.granted, timeout)
+
+    def get_position(self, ticket):
+        # 1 for the next message in line, 0 once the ticket holds a slot
+        with self._condition:
+            if ticket.granted:
+                return 0
+            for position, waiting in enumerate(self._waiting, 1):
+                if waiting is ticket:
+                    return position
+            return 0
+
+    def release(self, ticket):
+        # Gives the slot back, or leaves the queue; safe to call more than once
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.granted:
+                self._running_sessions.discard(ticket.session_id)
+                self._active -= 1
+                _active_generations.dec()
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+                _queue_depth.dec()
+            self._dispatch()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GenerationScheduler()
+    return _scheduler
@@ -0,0 +1,97 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional faster JSON backend
+    orjson = None
+
+def loads(data):
+    # Accepts bytes; orjson.JSONDecodeError subclasses json.JSONDecodeError
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event, data, id=None):
+        self.event = event
+        self.data = data
+        self.id = id
+
+class SSEParser:
+    # Incremental Server-Sent Events framer: feed raw byte chunks, get complete events back.
+    # Lines are located in one growing buffer and sliced through a memoryview, so
+    # only field values are copied out.
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data_lines = []
+        self._event = None
+        self._id = None
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        events = []
+        buffer = self._buffer
+        view = memoryview(buffer)
+        start = 0
+        try:
+            while True:
+                end = buffer.find(b"\n", start)
+                if end == -1:
+                    break
+                line_end = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+                if buffer.startswith(b"data: ", start, line_end):
+                    # Fast path for the overwhelmingly common field
+                    self._data_lines.append(view[start + 6:line_end].tobytes())
+                else:
+                    event = self._process_line(view[start:line_end])
+                    if event is not None:
+                        events.append(event)
+                start = end + 1
+        finally:
+            view.release()
+        if start:
+            del buffer[:start]
+        return events
+
+    def _process_line(self, line):
+        if not line:
+            return self._dispatch()
+        if line[0] == 0x3A:  # ":" comment, e.g. ": OPENROUTER PROCESSING"
+            return None
+        line = line.tobytes()
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            self._data_lines.append(value)
+        elif field == b"event":
+            self._event = value.decode("utf-8")
+        elif field == b"id":
+            self._id = value.decode("utf-8")
+        return None
+
+    def _dispatch(self):
+        if not self._data_lines:
+            self._event = None
+            return None
+        data = self._data_lines[0] if len(self._data_lines) == 1 else b"\n".join(self._data_lines)
+        event = SSEEvent(self._event or "message", data, self._id)
+        self._data_lines = []
+        self._event = None
+        return event
+
+    def close(self):
+        # Flush a final event that was not followed by a blank line
+        events = self.feed(b"\n") if self._buffer else []
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+def iter_sse_events(chunks):
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import time
+from api.sse import iter_sse_events, loads
+from monitoring.metrics import METRICS_ENABLED, RATE_BUCKETS, SIZE_BUCKETS, get_counter, get_histogram
+
+# UI refresh cadence: redraw after this many seconds or this many new deltas, whichever comes first
+RENDER_INTERVAL = 0.15
+RENDER_EVERY_DELTAS = 40
+# Partial answers are handed to on_checkpoint this often, so an interrupted stream keeps its text
+CHECKPOINT_INTERVAL = float(os.environ.get("GENERATION_CHECKPOINT_INTERVAL", 1.0))
+
+_time_to_first_token = get_histogram("generation_time_to_first_token_seconds", "Time from submitting the message to the first streamed delta")
+_generation_seconds = get_histogram("generation_duration_seconds", "Time from submitting the message to the end of the stream")
+_tokens_per_second = get_histogram("generation_tokens_per_second", "Streamed deltas per second after the first one", buckets=RATE_BUCKETS)
+_response_bytes = get_histogram("generation_response_bytes", "SSE bytes received per generation", buckets=SIZE_BUCKETS)
+_generation_errors = get_counter("generation_errors_total", "Generations that ended with an error")
+_checkpoint_errors = get_counter("generation_checkpoint_errors_total", "Checkpoints of a partial answer that could not be saved")
+
+_generations = {}
+_registry_lock = threading.Lock()
+# generation -> on_checkpoint; one shared thread checkpoints them, so the delta loop never reads the clock
+_checkpointing = {}
+_checkpointer = None
+
+class Generation:
+    # Assistant response streamed by a background thread, read by any script run showing it
+    def __init__(self, key, name, timestamp, started_at=None, message_id=None, prefix=""):
+        self.key = key
+        self.name = name
+        self.timestamp = timestamp
+        self.started_at = started_at  # perf_counter() when the message was submitted; None for replays
+        self.message_id = message_id  # Stored message the stream is written into, if any
+        self.deltas = [prefix] if prefix else []
+        self.prefix_deltas = len(self.deltas)
+        self.error = None
+        self.done = False
+        self._condition = threading.Condition()
+        self._text = ""
+        self._joined_deltas = 0
+        self._checkpoint_lock = threading.Lock()  # A checkpoint never runs after the final save
+        self._checkpointed_deltas = len(self.deltas)
+        self._checkpoints_stopped = False
+
+    @property
+    def text(self):
+        # Only deltas added since the last call are joined; redraws and checkpoints read this repeatedly
+        with self._condition:
+            if self._joined_deltas < len(self.deltas):
+                self._text += "".join(self.deltas[self._joined_deltas:])
+                self._joined_deltas = len(self.deltas)
+            return self._text
+
+    def append(self, delta):
+        with self._condition:
+            self.deltas.append(delta)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self.error = error
+            self.done = True
+            self._condition.notify_all()
+
+    def wait_for_update(self, seen_deltas, timeout=RENDER_INTERVAL, min_new_deltas=RENDER_EVERY_DELTAS):
+        # Blocks until enough new deltas arrived, the stream ended or the timeout passed
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.done or len(self.deltas) >= seen_deltas + min_new_deltas,
+                timeout
+            )
+            return len(self.deltas)
+
+def _get_stream_error(title, message):
+    return {"title": title, "subtitle": "", "message": message}
+
+class StreamError(Exception):
+    def __init__(self, error):
+        super().__init__(error.get("message"))
+        self.error = error
+
+def _count_response_bytes(chunks):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _response_bytes.observe(size)
+
+def iter_response_deltas(response):
+    # Content deltas of an SSE chat-completion response; the response is closed when iteration stops
+    chunks = response.iter_content(chunk_size=None)
+    if METRICS_ENABLED:
+        chunks = _count_response_bytes(chunks)
+    try:
+        for event in iter_sse_events(chunks):
+            if event.data == b"[DONE]":
+                break
+            json_data = loads(event.data)
+            stream_error = json_data.get("error")
+            if stream_error is not None:
+                raise StreamError(_get_stream_error("**❌ Error**", stream_error.get("message", str(stream_error))))
+            choices = json_data.get("choices")
+            if choices:
+                message_delta = choices[0].get("delta") or {}
+                content = message_delta.get("content")
+                if content:
+                    yield content
+    finally:
+        response.close()
+
+def _record_generation_metrics(generation, first_delta_at, error):
+    finished_at = time.perf_counter()
+    if error is not None:
+        _generation_errors.inc()
+    _generation_seconds.observe(finished_at - generation.started_at)
+    if first_delta_at is not None:
+        _time_to_first_token.observe(first_delta_at - generation.started_at)
+        streamed_deltas = len(generation.deltas) - generation.prefix_deltas
+        if streamed_deltas > 1 and finished_at > first_delta_at:
+            _tokens_per_second.observe((streamed_deltas - 1) / (finished_at - first_delta_at))
+
+def _run_generation(generation, deltas, callbacks):
+    try:
+        _consume_generation(generation, deltas, callbacks)
+    finally:
+        if callbacks.get("on_finish") is not None:
+            callbacks["on_finish"]()
+
+def _checkpoint(generation, on_checkpoint):
+    # Skipped while no new delta arrived, since each checkpoint rewrites the whole text.
+    # A failed checkpoint only costs what a crash right now would lose; the stream goes on.
+    with generation._checkpoint_lock:
+        if generation._checkpoints_stopped or len(generation.deltas) == generation._checkpointed_deltas:
+            return
+        generation._checkpointed_deltas = len(generation.deltas)
+        try:
+            on_checkpoint(generation.text)
+        except Exception:
+            _checkpoint_errors.inc()
+
+def _checkpoint_loop():
+    global _checkpointer
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        with _registry_lock:
+            if not _checkpointing:
+                _checkpointer = None
+                return
+            watched = list(_checkpointing.items())
+        for generation, on_checkpoint in watched:
+            _checkpoint(generation, on_checkpoint)
+
+def _start_checkpoints(generation, on_checkpoint):
+    global _checkpointer
+    with _registry_lock:
+        _checkpointing[generation] = on_checkpoint
+        if _checkpointer is None:
+            _checkpointer = threading.Thread(target=_checkpoint_loop, name="generation-checkpoints", daemon=True)
+            _checkpointer.start()
+
+def _stop_checkpoints(generation):
+    # Waits for a checkpoint in progress, so it cannot land after the final text
+    with _registry_lock:
+        _checkpointing.pop(generation, None)
+    with generation._checkpoint_lock:
+        generation._checkpoints_stopped = True
+
+def _consume_generation(generation, deltas, callbacks):
+    on_checkpoint = callbacks.get("on_checkpoint")
+    error = None
+    first_delta_at = None
+    if on_checkpoint is not None:
+        _start_checkpoints(generation, on_checkpoint)
+    try:
+        deltas = iter(deltas)
+        for delta in deltas:
+            first_delta_at = time.perf_counter()
+            generation.append(delta)
+            break
+        for delta in deltas:
+            generation.append(delta)
+    except StreamError as ex:
+        error = ex.error
+    except json.JSONDecodeError as ex:
+        error = _get_stream_error("**❌ Streaming Error**", f"JSON decode error: {ex}")
+    except KeyError as ex:
+        error = _get_stream_error("**❌ Streaming Error**", f"Missing key: {ex}")
+    except Exception as ex:
+        error = _get_stream_error("**❌ Streaming Error**", str(ex))
+
+    if on_checkpoint is not None:
+        _stop_checkpoints(generation)
+    if error is None:
+        try:
+            callbacks["on_complete"](generation.text)
+        except Exception as ex:
+            error = _get_stream_error("**❌ Error**", f"Failed to save the response: {ex}")
+    elif callbacks.get("on_error") is not None:
+        # Whatever arrived before the error is kept
+        try:
+            callbacks["on_error"](generation.text)
+        except Exception:
+            _checkpoint_errors.inc()
+
+    if METRICS_ENABLED and generation.started_at is not None:
+        _record_generation_metrics(generation, first_delta_at, error)
+
+    # Successful generations are already persisted, failed ones stay until a viewer collects the error
+    if error is None:
+        discard_generation(generation.key, generation)
+    generation.finish(error)
+
+def _start(key, deltas, name, timestamp, callbacks, started_at=None, message_id=None, prefix=""):
+    generation = Generation(key, name, timestamp, started_at, message_id, prefix)
+    with _registry_lock:
+        _generations[key] = generation
+    threading.Thread(
+        target=_run_generation,
+        args=(generation, deltas, callbacks),
+        name=f"generation-{key}",
+        daemon=True
+    ).start()
+    return generation
+
+def start_generation(key, response, name, timestamp, on_complete, started_at=None, deltas=None, on_finish=None,
+                     on_checkpoint=None, on_error=None, message_id=None, prefix=""):
+    # Consumes the SSE response on a daemon thread, independent of the Streamlit script run.
+    # on_checkpoint(text) runs every CHECKPOINT_INTERVAL while new deltas arrive, on a thread shared by
+    # all generations. The other callbacks run on the generation's thread, after the last checkpoint:
+    # on_complete(text) when the stream ends successfully or on_error(text) with the partial text,
+    # and on_finish() last, however the stream ended.
+    # started_at is the perf_counter() taken when the message was submitted.
+    # deltas, when given, is an iterator already reading the response (the model router peeks at the first delta).
+    # prefix is text already answered, when the stream continues an interrupted answer.
+    if started_at is None:
+        started_at = time.perf_counter()
+    if deltas is None:
+        deltas = iter_response_deltas(response)
+    callbacks = {"on_complete": on_complete, "on_finish": on_finish, "on_checkpoint": on_checkpoint, "on_error": on_error}
+    return _start(key, deltas, name, timestamp, callbacks, started_at, message_id, prefix)
+
+def start_replay(key, text, name, timestamp, on_complete, on_finish=None, message_id=None):
+    # Feeds a stored answer through the same path as a live generation
+    return _start(key, iter([text]), name, timestamp, {"on_complete": on_complete, "on_finish": on_finish}, message_id=message_id)
+
+def get_generation(key):
+    with _registry_lock:
+        return _generations.get(key)
+
+def is_generating(key):
+    generation = get_generation(key)
+    return generation is not None and not generation.done
+
+def discard_generation(key, generation=None):
+    with _registry_lock:
+        if generation is None or _generations.get(key) is generation:
+            _generations.pop(key, None)
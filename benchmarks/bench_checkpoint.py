@@ -0,0 +1,77 @@
+# Streaming throughput with and without checkpointing partial answers to the database.
+# Several long answers stream at once, each into its own stored message. The deltas come from memory
+# rather than a socket, so the generation threads run flat out and any checkpoint cost shows.
+# Usage: python -m benchmarks.bench_checkpoint [streams] [tokens]
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+INTERVALS = (None, 1.0, 0.1, 0.01)  # None streams without checkpoints
+RUNS = 5
+DELTA = "lorem ipsum "
+
+def stream_answers(session_ids, tokens, interval):
+    # Returns (deltas per second over all streams, checkpoints handed to the database)
+    from api import streaming
+    from db.chat_history import start_message, checkpoint_message, finish_message
+    streaming.CHECKPOINT_INTERVAL = interval or 0
+    checkpoints = []
+    generations = []
+    started = time.perf_counter()
+    for session_id in session_ids:
+        message_id = start_message(session_id, "assistant", "Benchmark")
+        def on_checkpoint(text, session_id=session_id, message_id=message_id):
+            checkpoints.append(len(text))
+            checkpoint_message(session_id, message_id, text)
+        generations.append(streaming.start_generation(
+            ("checkpoint", session_id), None, "Benchmark", None,
+            lambda text, session_id=session_id, message_id=message_id: finish_message(session_id, message_id, text),
+            deltas=(DELTA for _ in range(tokens)),
+            on_checkpoint=on_checkpoint if interval is not None else None
+        ))
+    deltas = 0
+    for generation in generations:
+        while not generation.done:
+            generation.wait_for_update(len(generation.deltas), timeout=0.1)
+        assert generation.error is None, generation.error
+        deltas += len(generation.deltas)
+    return deltas / (time.perf_counter() - started), len(checkpoints)
+
+def measure(streams=8, tokens=200_000):
+    # Returns {interval: (median deltas per second, checkpoints per run)}
+    from db import connection
+    from db.chat_history import init_db, create_session
+    from db.write_queue import flush_writes
+    from api import streaming
+    default_interval = streaming.CHECKPOINT_INTERVAL
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        init_db()
+        session_ids = [create_session(f"Stream {index}") for index in range(streams)]
+        runs = {interval: [] for interval in INTERVALS}
+        for _ in range(RUNS):
+            # Interleaved, so drift in machine load hits every interval alike
+            for interval in INTERVALS:
+                runs[interval].append(stream_answers(session_ids, tokens, interval))
+                flush_writes()
+        for interval, samples in runs.items():
+            results[interval] = (statistics.median(rate for rate, _ in samples), statistics.median(count for _, count in samples))
+        connection.close_connections()
+    streaming.CHECKPOINT_INTERVAL = default_interval
+    return results
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    results = measure(streams, tokens)
+    baseline = results[None][0]
+    print(f"{streams} concurrent streams of {tokens} deltas")
+    for interval, (rate, checkpoints) in results.items():
+        label = "no checkpoints" if interval is None else f"every {interval * 1000:.0f} ms"
+        print(f"{label:>16}: {rate:10.0f} deltas/s ({(rate / baseline - 1) * 100:+5.1f}%), {checkpoints} checkpoints")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Time to first paint: the first script run of a browser session, in a fresh process and in a warm one.
+# Every sample runs in its own interpreter, so module imports are really cold.
+# Usage: python -m benchmarks.bench_cold_start [runs]
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter. Streamlit itself is imported before the clock starts; what is
+# timed is the script run: the app's own imports, setup and rendering. The app runs through a
+# wrapper script that marks when it starts, and ForwardMsgs are timestamped as they are queued.
+CHILD = """
+import json, os, sys, tempfile, time
+import streamlit_javascript
+streamlit_javascript.st_javascript = lambda *args, **kwargs: "Asia/Jakarta"
+from streamlit.testing.v1 import AppTest
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from db import connection
+connection.DB_FILE = sys.argv[2]
+
+marks = {}
+enqueue = ForwardMsgQueue.enqueue
+def timed_enqueue(queue, msg):
+    kind = msg.WhichOneof("type")
+    if kind == "delta":
+        marks.setdefault("first_delta", time.perf_counter())
+    elif kind == "page_profile":
+        marks["finished"] = time.perf_counter()
+    return enqueue(queue, msg)
+ForwardMsgQueue.enqueue = timed_enqueue
+
+wrapper = os.path.join(tempfile.mkdtemp(), "wrapper.py")
+with open(wrapper, "w") as file:
+    file.write("import builtins, runpy, time\\n")
+    file.write("builtins.script_started_at = time.perf_counter()\\n")
+    file.write(f"runpy.run_path({sys.argv[1]!r}, run_name='__main__')\\n")
+
+import builtins
+timings = []
+for _ in range(2):
+    marks.clear()
+    app = AppTest.from_file(wrapper, default_timeout=60)
+    app.secrets["OPEN_ROUTER_API_KEY"] = "benchmark"
+    app.run()
+    assert not app.exception, app.exception
+    timings.append([marks["first_delta"] - builtins.script_started_at, marks["finished"] - builtins.script_started_at])
+print(json.dumps(timings))
+"""
+
+def run_child(db_file):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, os.path.join(ROOT, "chatbot.py"), db_file],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure(runs=5):
+    # Returns {(process, mark): median ms} for process in ("cold", "warm") and
+    # mark in ("first_paint", "full_run"): the first element sent, and the end of the script run
+    samples = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        run_child(db_file)  # Creates the schema, so every measured run starts from an existing database
+        for _ in range(runs):
+            for process, timings in zip(("cold", "warm"), run_child(db_file)):
+                for mark, seconds in zip(("first_paint", "full_run"), timings):
+                    samples.setdefault((process, mark), []).append(seconds * 1000)
+    return {key: statistics.median(values) for key, values in samples.items()}
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = measure(runs)
+    for process, label in (("cold", "fresh process"), ("warm", "new session in a warm process")):
+        print(f"{label}: first paint {results[(process, 'first_paint')]:.1f} ms, full script run {results[(process, 'full_run')]:.1f} ms")
+
+if __name__ == "__main__":
+    main()
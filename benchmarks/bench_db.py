@@ -0,0 +1,50 @@
+# Usage: python -m benchmarks.bench_db [message counts...]
+import os
+import sys
+import tempfile
+import time
+from db import connection
+from db import history_cache
+from db.chat_history import init_db, create_session, save_message_into_session, fetch_chat_history, HISTORY_PAGE_SIZE
+from db.write_queue import flush_writes
+
+SESSION_COUNT = 10
+
+def time_inserts(message_count):
+    # Messages per second through save_message_into_session, until committed
+    session_ids = [create_session(f"Session {i}") for i in range(SESSION_COUNT)]
+    started = time.perf_counter()
+    for i in range(message_count):
+        save_message_into_session(session_ids[i % SESSION_COUNT], "user", "User", f"Message number {i}")
+    flush_writes()
+    return message_count / (time.perf_counter() - started), session_ids
+
+def time_fetches(session_ids):
+    # Pages per second for the newest page of each session, read from the database
+    fetch_count = 0
+    started = time.perf_counter()
+    for session_id in session_ids * 20:
+        history_cache.invalidate(session_id)
+        fetch_chat_history(session_id, limit=HISTORY_PAGE_SIZE)
+        fetch_count += 1
+    return fetch_count / (time.perf_counter() - started)
+
+def measure(message_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        history_cache.invalidate()  # Session ids restart in every new database
+        init_db()
+        inserts_per_second, session_ids = time_inserts(message_count)
+        fetches_per_second = time_fetches(session_ids)
+        connection.close_connections()
+    return inserts_per_second, fetches_per_second
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000]
+    print(f"{'messages':>10} {'inserts/s':>12} {'page fetches/s':>16}")
+    for count in counts:
+        inserts_per_second, fetches_per_second = measure(count)
+        print(f"{count:>10} {inserts_per_second:>12.0f} {fetches_per_second:>16.0f}")
+
+if __name__ == "__main__":
+    main()
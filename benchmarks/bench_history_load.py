@@ -0,0 +1,64 @@
+# Usage: python -m benchmarks.bench_history_load [message counts...]
+import os
+import sys
+import tempfile
+import time
+from db import connection
+from db import history_cache
+from db.chat_history import fetch_chat_history
+from db.migrations import MIGRATIONS, migrate
+
+MESSAGES_PER_SESSION = 50
+REPEATS = 20
+
+def build_database(db_file, message_count):
+    connection.DB_FILE = db_file
+    with connection.get_connection() as conn:
+        migrate(conn, target_version=1)  # Unindexed schema, as shipped before versioning
+        session_count = message_count // MESSAGES_PER_SESSION
+        with conn:
+            conn.executemany(
+                "INSERT INTO sessions (id, name, created_at) VALUES (?, ?, ?)",
+                ((i, f"Session {i}", f"2025-01-01T00:00:{i % 60:02d}") for i in range(1, session_count + 1))
+            )
+            # Interleave sessions, like many conversations running side by side
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, name, content, files, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                ((i % session_count + 1, "user", "User", f"Message number {i}", None, "2025-01-01T00:00:00") for i in range(message_count))
+            )
+    return session_count
+
+def fetch_unmigrated_history(session_id):
+    # The same query as fetch_chat_history, limited to the columns the version 1 schema has
+    with connection.get_connection() as conn:
+        return conn.execute(
+            "SELECT id, role, name, content, files, timestamp FROM messages WHERE session_id=? ORDER BY id DESC",
+            (session_id,)
+        ).fetchall()
+
+def fetch_history(session_id):
+    history_cache.invalidate()  # Measure the database path, not the in-memory cache
+    return fetch_chat_history(session_id, limit=None)
+
+def time_history_load(session_id, fetch=fetch_history):
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        fetch(session_id)
+    return (time.perf_counter() - started) / REPEATS * 1000
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'messages':>10} {'before (ms)':>12} {'after (ms)':>12}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            session_count = build_database(os.path.join(tmp, "bench.db"), count)
+            target_session = session_count // 2
+            before = time_history_load(target_session, fetch_unmigrated_history)
+            with connection.get_connection() as conn:
+                migrate(conn, target_version=MIGRATIONS[-1][0])
+            after = time_history_load(target_session)
+            connection.close_connections()
+        print(f"{count:>10} {before:>12.3f} {after:>12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Websocket and image payload per rerun of a chat history with attachments, through Streamlit's AppTest.
+# Usage: python -m benchmarks.bench_render [message count]
+import io
+import os
+import sys
+import tempfile
+import time
+from benchmarks.fake_openrouter import start_fake_openrouter
+
+IMAGE_SIZE = (1600, 1200)
+RERUNS = 5
+
+class UploadedFile(io.BytesIO):
+    # Stands in for Streamlit's UploadedFile
+    def __init__(self, data, name, type):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+
+def make_image(seed):
+    from PIL import Image
+    noise = Image.effect_noise((160, 120), 40 + seed).convert("RGB")
+    output = io.BytesIO()
+    noise.resize(IMAGE_SIZE).save(output, format="PNG")
+    return output.getvalue()
+
+def build_history(message_count):
+    from db.chat_history import create_session, save_message_into_session
+    from db.write_queue import flush_writes
+    session_id = create_session("Render benchmark")
+    for index in range(message_count):
+        files = []
+        if index % 2 == 0:
+            files.append(UploadedFile(make_image(index % 5), f"photo-{index}.png", "image/png"))
+            files.append(UploadedFile(os.urandom(200_000), f"report-{index}.pdf", "application/pdf"))
+        save_message_into_session(session_id, "user", "User", f"Message number {index}", files=files)
+    flush_writes()
+    return session_id
+
+class PayloadRecorder:
+    # Tallies ForwardMsg bytes and image bytes handed to the media manager, per script run
+    def __init__(self):
+        self.messages = []
+        self.image_bytes = 0
+
+    def install(self):
+        from streamlit.elements.lib import image_utils
+        from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+        recorder = self
+        enqueue = ForwardMsgQueue.enqueue
+        ensure_image_size_and_format = image_utils._ensure_image_size_and_format
+
+        def recording_enqueue(queue, msg):
+            if msg.HasField("delta"):
+                recorder.messages.append(msg.SerializeToString())
+            return enqueue(queue, msg)
+
+        def recording_ensure_image_size_and_format(*args, **kwargs):
+            image_data = ensure_image_size_and_format(*args, **kwargs)
+            recorder.image_bytes += len(image_data)
+            return image_data
+
+        ForwardMsgQueue.enqueue = recording_enqueue
+        image_utils._ensure_image_size_and_format = recording_ensure_image_size_and_format
+
+    def take(self):
+        messages, image_bytes = self.messages, self.image_bytes
+        self.messages, self.image_bytes = [], 0
+        return messages, image_bytes
+
+def measure(message_count=20):
+    server, url = start_fake_openrouter()
+    from api import openrouter
+    from db import connection
+    from db.chat_history import init_db
+    openrouter.BASE_URL = url
+    # The browser timezone lookup needs a real frontend; AppTest has none
+    import streamlit_javascript
+    streamlit_javascript.st_javascript = lambda *args, **kwargs: "UTC"
+    from streamlit.testing.v1 import AppTest
+
+    recorder = PayloadRecorder()
+    recorder.install()
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        init_db()
+        build_history(message_count)
+        app = AppTest.from_file(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot.py"), default_timeout=60)
+        app.secrets["OPEN_ROUTER_API_KEY"] = "benchmark"
+        app.run()
+        previous_messages, _ = recorder.take()
+        delta_bytes, changed_bytes, image_bytes, durations = [], [], [], []
+        for _ in range(RERUNS):
+            started = time.perf_counter()
+            app.run()
+            durations.append(time.perf_counter() - started)
+            messages, rerun_image_bytes = recorder.take()
+            # Deltas identical to the previous run are the ones the browser can keep as they are
+            unchanged = set(previous_messages)
+            delta_bytes.append(sum(len(message) for message in messages))
+            changed_bytes.append(sum(len(message) for message in messages if message not in unchanged))
+            image_bytes.append(rerun_image_bytes)
+            previous_messages = messages
+    server.shutdown()
+    return {
+        "delta_kb": sum(delta_bytes) / RERUNS / 1024,
+        "changed_delta_kb": sum(changed_bytes) / RERUNS / 1024,
+        "image_kb": sum(image_bytes) / RERUNS / 1024,
+        "rerun_ms": min(durations) * 1000,
+    }
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    results = measure(message_count)
+    print(f"{message_count} messages, {message_count // 2} with a {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} image and a PDF")
+    print(f"delta messages per rerun:   {results['delta_kb']:.1f} KB")
+    print(f"changed since previous run: {results['changed_delta_kb']:.1f} KB")
+    print(f"image bytes per rerun:      {results['image_kb']:.1f} KB")
+    print(f"fastest rerun:              {results['rerun_ms']:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Time to first token per routing mode against the fake OpenRouter server serving three models:
+# one that always answers 503, a slow one and a fast one.
+# Usage: python -m benchmarks.bench_routing [requests]
+import os
+import statistics
+import sys
+import tempfile
+import time
+from benchmarks.fake_openrouter import start_fake_openrouter
+
+FLAKY_MODEL = "fake/flaky"
+SLOW_MODEL = "fake/slow"
+FAST_MODEL = "fake/fast"
+MODELS = [FLAKY_MODEL, SLOW_MODEL, FAST_MODEL]  # Configured order: worst first
+SLOW_FIRST_TOKEN_DELAY = 0.3
+FAST_FIRST_TOKEN_DELAY = 0.05
+MODES = ("fallback", "latency", "race")
+
+def build_data(model):
+    return f'{{"model": "{model}", "messages": [], "stream": true}}'.encode()
+
+def run_mode(url, mode, requests):
+    from api import routing
+    from db.write_queue import flush_writes
+    routing._stats = None  # Start from what the previous modes persisted
+    time_to_first_token = []
+    answered_by = {}
+    for _ in range(requests):
+        started = time.perf_counter()
+        route = routing.route_chat_completion({}, build_data, url=url, models=MODELS, mode=mode)
+        deltas = iter(route.deltas)
+        next(deltas)
+        time_to_first_token.append(time.perf_counter() - started)
+        for _ in deltas:
+            pass
+        answered_by[route.model] = answered_by.get(route.model, 0) + 1
+    flush_writes()
+    return statistics.median(time_to_first_token) * 1000, answered_by
+
+def measure(requests=10):
+    # Returns {mode: (median time to first token in ms, {model: answers})}
+    server, url = start_fake_openrouter(tokens=20, models={
+        FLAKY_MODEL: {"fail_first": 10 ** 9, "fail_status": 503},
+        SLOW_MODEL: {"first_token_delay": SLOW_FIRST_TOKEN_DELAY},
+        FAST_MODEL: {"first_token_delay": FAST_FIRST_TOKEN_DELAY},
+    })
+    from db import connection
+    from db.chat_history import init_db
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        init_db()
+        for mode in MODES:
+            results[mode] = run_mode(url, mode, requests)
+    server.shutdown()
+    return results
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"first token delay: {SLOW_MODEL} {SLOW_FIRST_TOKEN_DELAY * 1000:.0f} ms, {FAST_MODEL} {FAST_FIRST_TOKEN_DELAY * 1000:.0f} ms, {FLAKY_MODEL} answers 503")
+    for mode, (time_to_first_token, answered_by) in measure(requests).items():
+        answers = ", ".join(f"{model} x{count}" for model, count in sorted(answered_by.items()))
+        print(f"{mode:>8}: median time to first token {time_to_first_token:7.1f} ms ({answers})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Load test of the generation scheduler: many sessions send at once, each from two tabs,
+# against the fake OpenRouter server. Every message goes through the same path as the app:
+# queue ticket, routed request, background stream, save, slot release.
+# Usage: python -m benchmarks.bench_scheduler [sessions] [max_concurrent]
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.fake_openrouter import start_fake_openrouter
+
+MODEL = "fake/model"
+MESSAGES_PER_SESSION = 2  # Sent together, as from two tabs of the same session
+FIRST_TOKEN_DELAY = 0.05
+TOKENS_PER_SECOND = 400
+TOKENS = 40
+
+def build_data(model):
+    return f'{{"model": "{model}", "messages": [], "stream": true}}'.encode()
+
+def send_message(scheduler, url, session_id, index, answers, queue_waits, done):
+    # scheduler=None sends straight away, as before the scheduler existed
+    from api.routing import route_chat_completion
+    from api.streaming import start_generation
+    submitted_at = time.perf_counter()
+    ticket = scheduler.submit(session_id) if scheduler is not None else None
+    def on_finish():
+        if ticket is not None:
+            scheduler.release(ticket)
+        done.release()
+    handed_off = False
+    try:
+        if ticket is not None:
+            scheduler.wait(ticket)
+        queue_waits.append(time.perf_counter() - submitted_at)
+        route = route_chat_completion({}, build_data, url=url, models=[MODEL], mode="fallback")
+        on_complete = lambda text: answers[session_id].append(index)
+        # Keyed by message: without the scheduler, two streams of one session run side by side
+        start_generation((session_id, index), route.response, MODEL, None, on_complete, deltas=route.deltas, on_finish=on_finish)
+        handed_off = True
+    finally:
+        if not handed_off:
+            on_finish()
+
+def run(url, sessions, max_concurrent):
+    # Returns (elapsed seconds, queue waits, {session_id: answer order}); max_concurrent=None runs without the scheduler
+    from api.scheduler import GenerationScheduler
+    scheduler = GenerationScheduler(max_concurrent) if max_concurrent is not None else None
+    answers = {session_id: [] for session_id in range(sessions)}
+    queue_waits = []
+    done = threading.Semaphore(0)
+    threads = []
+    started = time.perf_counter()
+    for index in range(MESSAGES_PER_SESSION):
+        for session_id in range(sessions):
+            thread = threading.Thread(target=send_message, args=(scheduler, url, session_id, index, answers, queue_waits, done))
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+    for _ in threads:
+        done.acquire()
+    return time.perf_counter() - started, queue_waits, answers
+
+def measure(sessions=100, max_concurrent=8):
+    # Returns {"scheduled": result, "unbounded": result}, each with peak_streams, queue_wait_p50_ms,
+    # queue_wait_p95_ms, messages_per_second and out_of_order (sessions whose answers were reordered)
+    from db import connection
+    from db.chat_history import init_db
+    from db.write_queue import flush_writes
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        init_db()
+        for label, limit in (("scheduled", max_concurrent), ("unbounded", None)):
+            server, url = start_fake_openrouter(tokens=TOKENS, tokens_per_second=TOKENS_PER_SECOND, first_token_delay=FIRST_TOKEN_DELAY)
+            elapsed, queue_waits, answers = run(url, sessions, limit)
+            server.shutdown()
+            quantiles = statistics.quantiles(queue_waits, n=20)
+            results[label] = {
+                "peak_streams": server.peak_streams,
+                "queue_wait_p50_ms": statistics.median(queue_waits) * 1000,
+                "queue_wait_p95_ms": quantiles[18] * 1000,
+                "messages_per_second": len(queue_waits) / elapsed,
+                "out_of_order": sum(order != sorted(order) for order in answers.values()),
+            }
+        flush_writes()
+        connection.close_connections()
+    return results
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    max_concurrent = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{sessions} sessions x {MESSAGES_PER_SESSION} messages, {TOKENS} tokens at {TOKENS_PER_SECOND}/s after {FIRST_TOKEN_DELAY * 1000:.0f} ms")
+    for label, result in measure(sessions, max_concurrent).items():
+        limit = f"limit {max_concurrent}" if label == "scheduled" else "no limit"
+        print(
+            f"{label:>9} ({limit}): peak {result['peak_streams']} concurrent streams, "
+            f"queue wait p50 {result['queue_wait_p50_ms']:.0f} ms / p95 {result['queue_wait_p95_ms']:.0f} ms, "
+            f"{result['messages_per_second']:.1f} messages/s, {result['out_of_order']} sessions answered out of order"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Usage: python -m benchmarks.bench_search [message count]
+import itertools
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from db import connection
+from db.chat_history import init_db, search_messages
+
+MESSAGES_PER_SESSION = 50
+WORDS_PER_MESSAGE = 30
+VOCABULARY_SIZE = 20_000
+REPEATS = 20
+
+def build_vocabulary():
+    # Pseudo-words of natural lengths, so prefixes expand to a realistic number of terms
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(random.choices(string.ascii_lowercase, k=random.randint(3, 10))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+def get_queries(vocabulary):
+    # Vocabulary is ordered by frequency rank: index 0 is the most common word
+    return [
+        vocabulary[0],
+        vocabulary[50],
+        vocabulary[15_000],
+        f"{vocabulary[10]} {vocabulary[200]}",
+        vocabulary[300][:3],
+        vocabulary[5_000][:5],
+        "zzzzzzzzzzzz",
+    ]
+
+def build_database(message_count, vocabulary):
+    # Zipf-like word frequencies, as in natural text
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY_SIZE)))
+    session_count = max(1, message_count // MESSAGES_PER_SESSION)
+    with connection.get_connection() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT INTO sessions (id, name, created_at) VALUES (?, ?, ?)",
+                ((i, f"Session {i}", "2025-01-01T00:00:00") for i in range(1, session_count + 1))
+            )
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, name, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (i % session_count + 1, "user", "User", " ".join(random.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_MESSAGE)), "2025-01-01T00:00:00")
+                    for i in range(message_count)
+                )
+            )
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        init_db()
+        random.seed(42)
+        vocabulary = build_vocabulary()
+        started = time.perf_counter()
+        build_database(message_count, vocabulary)
+        print(f"Indexed {message_count} messages in {time.perf_counter() - started:.1f} s")
+        print(f"{'query':>18} {'hits (page)':>12} {'ms / query':>11}")
+        for query in get_queries(vocabulary):
+            started = time.perf_counter()
+            for _ in range(REPEATS):
+                results = search_messages(query, limit=20)
+            elapsed = (time.perf_counter() - started) / REPEATS * 1000
+            print(f"{query:>18} {len(results):>12} {elapsed:>11.2f}")
+        connection.close_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Usage: python -m benchmarks.bench_sse [delta counts...]
+import json
+import sys
+import time
+from api import sse
+from api.sse import iter_sse_events, loads
+
+CHUNK_SIZE = 8192
+
+def record_stream(delta_count):
+    # Recorded OpenRouter-style stream, re-chunked the way it arrives from the socket
+    events = [b": OPENROUTER PROCESSING\n\n"]
+    for index in range(delta_count):
+        event = {"id": "gen-1", "model": "openai/gpt-4.1", "choices": [{"index": 0, "delta": {"role": "assistant", "content": f"token{index} "}}]}
+        events.append(b"data: " + json.dumps(event).encode() + b"\n\n")
+    events.append(b"data: [DONE]\n\n")
+    stream = b"".join(events)
+    return [stream[i:i + CHUNK_SIZE] for i in range(0, len(stream), CHUNK_SIZE)]
+
+def iter_lines(chunks):
+    # Same framing as requests' Response.iter_lines
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        pending = lines.pop() if lines and lines[-1] and chunk[-1:] == lines[-1][-1:] else None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+def parse_line_based(chunks):
+    # Previous approach: decode every line, slice, stdlib json, string +=
+    generated_response = ""
+    for line in iter_lines(chunks):
+        if line:
+            decoded_line = line.decode("utf-8")
+            if decoded_line.startswith("data: "):
+                data = decoded_line[6:]
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices")
+                if choices:
+                    generated_response += choices[0].get("delta").get("content") or ""
+    return generated_response
+
+def parse_incremental(chunks):
+    deltas = []
+    for event in iter_sse_events(chunks):
+        if event.data == b"[DONE]":
+            break
+        choices = loads(event.data).get("choices")
+        if choices:
+            deltas.append(choices[0].get("delta").get("content") or "")
+    return "".join(deltas)
+
+def best_of(function, chunks, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function(chunks)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, result
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    backend = "orjson" if sse.orjson is not None else "json"
+    print(f"{'deltas':>8} {'line-based (ms)':>16} {f'incremental+{backend} (ms)':>26}")
+    for count in counts:
+        chunks = record_stream(count)
+        legacy_ms, legacy_text = best_of(parse_line_based, chunks)
+        incremental_ms, incremental_text = best_of(parse_incremental, chunks)
+        assert legacy_text == incremental_text
+        print(f"{count:>8} {legacy_ms:>16.1f} {incremental_ms:>26.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Bulk export/import throughput, with message-at-a-time saving as the baseline.
+# Usage: python -m benchmarks.bench_transfer [messages] [message_bytes]
+# e.g. 2000000 1024 for a ~2 GB history.
+import os
+import random
+import sys
+import tempfile
+import time
+from db import connection
+from db.chat_history import init_db, export_sessions, import_sessions, save_message_into_session, create_session
+from db.write_queue import flush_writes
+
+MESSAGES_PER_SESSION = 100
+BASELINE_MESSAGES = 5000
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor"]
+
+def build_contents(message_bytes, count=1000):
+    # A pool of varied texts, so gzip sees something closer to real prose than one repeated string
+    rng = random.Random(0)
+    contents = []
+    for _ in range(count):
+        text = ""
+        while len(text) < message_bytes:
+            text += rng.choice(WORDS) + " "
+        contents.append(text[:message_bytes])
+    return contents
+
+def build_database(db_file, message_count, contents):
+    connection.DB_FILE = db_file
+    init_db()
+    with connection.get_connection() as conn:
+        session_count = max(1, message_count // MESSAGES_PER_SESSION)
+        with conn:
+            conn.executemany(
+                "INSERT INTO sessions (id, name, created_at) VALUES (?, ?, ?)",
+                ((i, f"Session {i}", "2025-01-01T00:00:00") for i in range(1, session_count + 1))
+            )
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, name, content, files, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (i // MESSAGES_PER_SESSION % session_count + 1, "user" if i % 2 == 0 else "assistant", "User", contents[i % len(contents)], None, "2025-01-01T00:00:00")
+                    for i in range(message_count)
+                )
+            )
+
+def time_call(call):
+    started = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - started
+
+def measure_baseline(db_file, contents):
+    # Messages per second through save_message_into_session, one queued write each
+    connection.DB_FILE = db_file
+    init_db()
+    session_id = create_session("Baseline")
+    started = time.perf_counter()
+    for i in range(BASELINE_MESSAGES):
+        save_message_into_session(session_id, "user", "User", contents[i % len(contents)], "2025-01-01T00:00:00")
+    flush_writes()
+    return BASELINE_MESSAGES / (time.perf_counter() - started)
+
+def measure(message_count=100_000, message_bytes=1024):
+    # Returns {export_mb_per_second, export_gz_mb_per_second, import_mb_per_second,
+    # import_messages_per_second, baseline_messages_per_second, content_mb, export_gz_mb}
+    contents = build_contents(message_bytes)
+    content_mb = message_count * message_bytes / 1024 / 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        build_database(os.path.join(tmp, "source.db"), message_count, contents)
+        plain_path = os.path.join(tmp, "export.jsonl")
+        gz_path = os.path.join(tmp, "export.jsonl.gz")
+        _, export_seconds = time_call(lambda: export_sessions(plain_path))
+        _, export_gz_seconds = time_call(lambda: export_sessions(gz_path))
+        connection.DB_FILE = os.path.join(tmp, "target.db")
+        init_db()
+        (_, imported), import_seconds = time_call(lambda: import_sessions(gz_path))
+        baseline = measure_baseline(os.path.join(tmp, "baseline.db"), contents)
+        export_gz_mb = os.path.getsize(gz_path) / 1024 / 1024
+        connection.close_connections()
+    return {
+        "content_mb": content_mb,
+        "export_gz_mb": export_gz_mb,
+        "export_mb_per_second": content_mb / export_seconds,
+        "export_gz_mb_per_second": content_mb / export_gz_seconds,
+        "import_mb_per_second": content_mb / import_seconds,
+        "import_messages_per_second": imported / import_seconds,
+        "baseline_messages_per_second": baseline,
+    }
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    message_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    results = measure(message_count, message_bytes)
+    print(f"{message_count} messages of {message_bytes} bytes: {results['content_mb']:.0f} MB of content, {results['export_gz_mb']:.0f} MB gzipped")
+    print(f"export to .jsonl:    {results['export_mb_per_second']:8.1f} MB/s")
+    print(f"export to .jsonl.gz: {results['export_gz_mb_per_second']:8.1f} MB/s")
+    print(f"import from .jsonl.gz: {results['import_mb_per_second']:6.1f} MB/s, {results['import_messages_per_second']:.0f} messages/s")
+    print(f"save_message_into_session baseline: {results['baseline_messages_per_second']:.0f} messages/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# End-to-end time to first token through Streamlit's AppTest harness and the fake OpenRouter server.
+# Usage: python -m benchmarks.bench_ttft [runs]
+import os
+import statistics
+import sys
+import tempfile
+import time
+from benchmarks.fake_openrouter import start_fake_openrouter
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot.py")
+TOKENS = 200
+FIRST_TOKEN_DELAY = 0.05
+
+def start_app(url):
+    from api import openrouter
+    openrouter.BASE_URL = url
+    # The browser timezone lookup needs a real frontend; AppTest has none
+    import streamlit_javascript
+    streamlit_javascript.st_javascript = lambda *args, **kwargs: "UTC"
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(APP_FILE, default_timeout=60)
+    app.secrets["OPEN_ROUTER_API_KEY"] = "benchmark"
+    app.run()
+    return app
+
+def send_prompt(app, text):
+    # chat_input cannot carry files in AppTest, so the submitted message is set directly
+    app.session_state["pending_message"] = {"text": text, "files": []}
+    app.session_state["generating_response"] = True
+    app.run()
+
+def is_answered(message):
+    return message.get("role") == "assistant" and message.get("status") == "complete"
+
+def measure(runs=5):
+    server, url = start_fake_openrouter(tokens=TOKENS, first_token_delay=FIRST_TOKEN_DELAY)
+    from db import connection
+    from db.chat_history import init_db, create_session, fetch_chat_history
+    time_to_first_token = []
+    time_to_complete = []
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.DB_FILE = os.path.join(tmp, "bench.db")
+        init_db()
+        session_id = create_session("Benchmark")
+        app = start_app(url)
+        for index in range(runs):
+            request_count = len(server.requests)
+            started = time.perf_counter()
+            send_prompt(app, f"Benchmark prompt {index}")
+            # The answer is stored as soon as it starts streaming, so completion is read from its status
+            while not is_answered(fetch_chat_history(session_id, limit=1)[-1]):
+                app.run()
+            time_to_complete.append(time.perf_counter() - started)
+            request = server.requests[request_count]
+            # The server writes the first delta straight after this mark; on loopback the app reads it immediately
+            time_to_first_token.append(request["first_token_at"] - started)
+    server.shutdown()
+    return (
+        statistics.median(time_to_first_token) * 1000,
+        statistics.median(time_to_complete) * 1000
+    )
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    time_to_first_token, time_to_complete = measure(runs)
+    print(f"first token delay in the fake server: {FIRST_TOKEN_DELAY * 1000:.0f} ms, {TOKENS} tokens")
+    print(f"median time to first token: {time_to_first_token:.1f} ms")
+    print(f"median time to complete response: {time_to_complete:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Local stand-in for the OpenRouter chat-completions SSE endpoint.
+# Usage: python -m benchmarks.fake_openrouter [port]
+# then run the app with OPENROUTER_BASE_URL=http://127.0.0.1:<port>/api/v1/chat/completions
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_OPTIONS = {
+    "tokens": 200,          # Deltas per response
+    "token_text": "lorem ",  # Content of each delta
+    "tokens_per_second": 0,  # 0 streams as fast as possible
+    "first_token_delay": 0.0,
+    "fail_first": 0,         # Requests answered with fail_status before streaming succeeds
+    "fail_status": 429,
+    "retry_after": None,
+    "models": {},            # Per-model overrides keyed by the request's "model", e.g. {"a/slow": {"first_token_delay": 1}}
+}
+
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client dropped the connection, e.g. after its model lost a race
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        server = self.server
+        body = self._read_body()
+        try:
+            model = json.loads(body).get("model")
+        except ValueError:
+            model = None
+        options = {**server.options, **server.options["models"].get(model, {})}
+        request = {"path": self.path, "headers": dict(self.headers), "body_size": len(body), "model": model, "received_at": time.perf_counter()}
+        with server.lock:
+            server.requests.append(request)
+            # fail_first counts separately for every model
+            failures_left = server.failures_left.setdefault(model, options["fail_first"])
+            should_fail = failures_left > 0
+            if should_fail:
+                server.failures_left[model] -= 1
+
+        if should_fail:
+            # region Error response, shaped like OpenRouter's
+            error = json.dumps({"error": {"message": "Simulated failure", "code": options["fail_status"]}}).encode()
+            self.send_response(options["fail_status"])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(error)))
+            if options["retry_after"] is not None:
+                self.send_header("Retry-After", str(options["retry_after"]))
+            self.end_headers()
+            self.wfile.write(error)
+            return
+            # endregion
+
+        with server.lock:
+            server.active_streams += 1
+            server.peak_streams = max(server.peak_streams, server.active_streams)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._write_chunk(b": OPENROUTER PROCESSING\n\n")
+            time.sleep(options["first_token_delay"])
+            interval = 1 / options["tokens_per_second"] if options["tokens_per_second"] else 0
+            request["first_token_at"] = time.perf_counter()
+            for index in range(options["tokens"]):
+                event = {"id": "gen-fake", "choices": [{"index": 0, "delta": {"role": "assistant", "content": options["token_text"]}}]}
+                self._write_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+                if interval:
+                    time.sleep(interval)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        finally:
+            with server.lock:
+                server.active_streams -= 1
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+def start_fake_openrouter(port=0, **options):
+    # Starts the server on a background thread, returns (server, url)
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenRouterHandler)
+    server.daemon_threads = True
+    server.options = {**DEFAULT_OPTIONS, **options}
+    server.failures_left = {}
+    server.requests = []
+    server.active_streams = 0  # Responses being streamed right now
+    server.peak_streams = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server, url = start_fake_openrouter(port, tokens_per_second=50)
+    print(f"Fake OpenRouter listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
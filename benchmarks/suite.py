@@ -0,0 +1,203 @@
+# Runs every benchmark at a fixed size, stores the results and compares them with an earlier run.
+# Usage: python -m benchmarks.suite [--baseline results/<file>.json] [--threshold 0.1] [--check]
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPEATS = 3  # Best of, to keep run-to-run noise under the regression threshold
+
+# name -> whether a larger value is better
+METRICS = {
+    "db_inserts_per_second": True,
+    "db_page_fetches_per_second": True,
+    "history_load_100k_ms": False,
+    "sse_parse_100k_deltas_ms": False,
+    "request_body_3x10mb_encode_ms": False,
+    "request_body_3x10mb_peak_mb": False,
+    "time_to_first_token_ms": False,
+    "time_to_complete_response_ms": False,
+    "render_changed_delta_kb": False,
+    "render_image_kb": False,
+    "render_rerun_ms": False,
+    "routing_race_time_to_first_token_ms": False,
+    "routing_latency_time_to_first_token_ms": False,
+    "transfer_export_gz_mb_per_second": True,
+    "transfer_import_mb_per_second": True,
+    "cold_start_first_paint_ms": False,
+    "warm_session_first_paint_ms": False,
+    "scheduler_queue_wait_p95_ms": False,
+    "scheduler_messages_per_second": True,
+    "checkpointed_stream_deltas_per_second": True,
+}
+
+def run_db():
+    from benchmarks import bench_db
+    runs = [bench_db.measure(10_000) for _ in range(REPEATS)]
+    inserts_per_second = max(run[0] for run in runs)
+    fetches_per_second = max(run[1] for run in runs)
+    return {"db_inserts_per_second": inserts_per_second, "db_page_fetches_per_second": fetches_per_second}
+
+def run_history_load():
+    from benchmarks import bench_history_load
+    from db import connection
+    from db.migrations import migrate
+    with tempfile.TemporaryDirectory() as tmp:
+        session_count = bench_history_load.build_database(os.path.join(tmp, "bench.db"), 100_000)
+        with connection.get_connection() as conn:
+            migrate(conn)
+        history_load_ms = bench_history_load.time_history_load(session_count // 2)
+        connection.close_connections()
+    return {"history_load_100k_ms": history_load_ms}
+
+def run_sse():
+    from benchmarks import bench_sse
+    parse_ms, _ = bench_sse.best_of(bench_sse.parse_incremental, bench_sse.record_stream(100_000))
+    return {"sse_parse_100k_deltas_ms": parse_ms}
+
+def run_request_body():
+    from benchmarks import bench_request_body
+    attachments = [bytes(10 * 1024 * 1024) for _ in range(bench_request_body.ATTACHMENT_COUNT)]
+    encode_timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        bench_request_body.build_payload_streaming(attachments)
+        encode_timings.append(time.perf_counter() - started)
+    encode_ms = min(encode_timings) * 1000
+    _, peak_mb = bench_request_body.peak_memory(bench_request_body.build_payload_streaming, attachments)
+    return {"request_body_3x10mb_encode_ms": encode_ms, "request_body_3x10mb_peak_mb": peak_mb}
+
+def run_time_to_first_token():
+    from benchmarks import bench_ttft
+    time_to_first_token, time_to_complete = bench_ttft.measure()
+    return {"time_to_first_token_ms": time_to_first_token, "time_to_complete_response_ms": time_to_complete}
+
+def run_render():
+    from benchmarks import bench_render
+    results = bench_render.measure()
+    return {
+        "render_changed_delta_kb": results["changed_delta_kb"],
+        "render_image_kb": results["image_kb"],
+        "render_rerun_ms": results["rerun_ms"],
+    }
+
+def run_routing():
+    from benchmarks import bench_routing
+    results = bench_routing.measure()
+    return {
+        "routing_race_time_to_first_token_ms": results["race"][0],
+        "routing_latency_time_to_first_token_ms": results["latency"][0],
+    }
+
+def run_transfer():
+    from benchmarks import bench_transfer
+    results = bench_transfer.measure(message_count=20_000)
+    return {
+        "transfer_export_gz_mb_per_second": results["export_gz_mb_per_second"],
+        "transfer_import_mb_per_second": results["import_mb_per_second"],
+    }
+
+def run_cold_start():
+    from benchmarks import bench_cold_start
+    results = bench_cold_start.measure(runs=3)
+    return {
+        "cold_start_first_paint_ms": results[("cold", "first_paint")],
+        "warm_session_first_paint_ms": results[("warm", "first_paint")],
+    }
+
+def run_scheduler():
+    from benchmarks import bench_scheduler
+    results = bench_scheduler.measure()["scheduled"]
+    return {
+        "scheduler_queue_wait_p95_ms": results["queue_wait_p95_ms"],
+        "scheduler_messages_per_second": results["messages_per_second"],
+    }
+
+def run_checkpoint():
+    from benchmarks import bench_checkpoint
+    results = bench_checkpoint.measure()
+    return {"checkpointed_stream_deltas_per_second": results[1.0][0]}  # The default interval
+
+BENCHMARKS = [run_db, run_history_load, run_sse, run_request_body, run_time_to_first_token, run_render, run_routing, run_transfer, run_cold_start, run_scheduler, run_checkpoint]
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(metrics):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = get_commit()
+    created_at = datetime.now()
+    path = os.path.join(RESULTS_DIR, f"{created_at.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json")
+    with open(path, "w") as results_file:
+        json.dump({
+            "created_at": created_at.isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "metrics": metrics
+        }, results_file, indent=2)
+    return path
+
+def get_latest_results(exclude=None):
+    paths = sorted(path for path in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if path != exclude)
+    return paths[-1] if paths else None
+
+def compare(metrics, baseline_metrics, threshold):
+    # Prints the change per metric, returns the names that got worse by more than threshold
+    regressions = []
+    print(f"{'metric':<32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, higher_is_better in METRICS.items():
+        current, baseline = metrics.get(name), baseline_metrics.get(name)
+        if current is None or not baseline:
+            current_text = f"{current:.2f}" if current is not None else "-"
+            print(f"{name:<32} {'-':>12} {current_text:>12}")
+            continue
+        change = (current - baseline) / baseline
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<32} {baseline:>12.2f} {current:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", help="results file to compare with (default: the previous run)")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 when a metric regressed")
+    args = parser.parse_args()
+
+    metrics = {}
+    for benchmark in BENCHMARKS:
+        print(f"running {benchmark.__name__[len('run_'):]}...", flush=True)
+        metrics.update(benchmark())
+    path = save_results(metrics)
+    print(f"results saved to {path}")
+
+    baseline_path = args.baseline or get_latest_results(exclude=path)
+    if baseline_path is None:
+        for name, value in metrics.items():
+            print(f"{name:<32} {value:>12.2f}")
+        return
+    with open(baseline_path) as baseline_file:
+        baseline_metrics = json.load(baseline_file).get("metrics", {})
+    print(f"compared with {baseline_path}")
+    regressions = compare(metrics, baseline_metrics, args.threshold)
+    if regressions and args.check:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
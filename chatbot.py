@@ -1,26 +1,34 @@
 import datetime
+import time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import streamlit as st
 from streamlit_javascript import st_javascript
-import pytz
-import requests
 import json
 import base64
-import mimetypes
-import uuid
-import io
-from db.chat_history import init_db, save_message_into_session, fetch_chat_history, create_session, get_sessions, delete_all_sessions
+from db.chat_history import init_db, save_message_into_session, start_message, checkpoint_message, finish_message, fetch_chat_history, has_earlier_messages, search_messages, create_session, get_sessions_page, get_session, has_sessions, session_name_exists, delete_session, archive_session, delete_all_sessions, fetch_attachment, DEFAULT_USER_ID, HISTORY_PAGE_SIZE, SESSION_PAGE_SIZE
+from db.attachments import hash_content
+from db.storage import StorageError, MESSAGE_COMPLETE, MESSAGE_FAILED
+from db.response_cache import RESPONSE_CACHE_ENABLED, get_response_cache_key, get_cached_response, store_response
+from api.models import MODELS, ROUTING_MODE
+from api.scheduler import MAX_QUEUE_WAIT, get_scheduler
+from api.streaming import start_generation, start_replay, get_generation, is_generating, discard_generation
+from api.context import build_context_messages
+from api.preprocess import preprocess_attachments, get_thumbnail
+from api.request_body import Base64DataUri, JsonStreamBody
+from monitoring.metrics import METRICS_ENABLED, METRICS_DEBUG_PANEL, get_histogram, get_snapshot, start_exporters
 
 # region Variables
-BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
-MODEL = "openai/gpt-4.1"
 ACCEPTED_FILE_TYPES = ["jpg", "jpeg", "png", "pdf"]
 USER = "user"
 ASSISTANT = "assistant"
-
-timezone = st_javascript("""await (async () => {
-            const userTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
-            return userTimezone
-})().then(returnValue => returnValue)""")
+ASSISTANT_NAME = "AI Assistant"
+SEARCH_RESULTS_LIMIT = 10
+TYPING_LABEL = "Please wait, the AI assistant is typing a message..."
+QUEUE_POLL_INTERVAL = 0.25  # Seconds between queue position refreshes
+
+render_page_seconds = get_histogram("render_page_seconds", "Script run time up to the live response stream")
+render_history_seconds = get_histogram("render_history_seconds", "Time to draw the loaded chat history")
+script_started_at = time.perf_counter()
 # endregion
 
 # region State Initialization
@@ -33,6 +41,10 @@ def initialize_session_state():
         "session_changed": False,
         "generating_response": False,
         "input_error_message": {},
+        "history_since_ids": {},
+        "session_offset": 0,
+        "expanded_images": set(),
+        "timezone": None,  # Browser timezone, probed once per session at the end of the page
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -43,75 +55,43 @@ initialize_session_state()
 # endregion
 
 # region Methods
-def get_timestamp():
-    user_tz = pytz.timezone(timezone)
-    return datetime.datetime.now(user_tz).isoformat()
+def get_user_id():
+    # Signed-in users (st.login) only see their own sessions; otherwise every visitor shares one history
+    if st.user.get("is_logged_in"):
+        return st.user.get("email") or st.user.get("sub")
+    return DEFAULT_USER_ID
 
-def generate_assistant_response(response):
+def get_timestamp():
+    # UTC until the browser has answered the timezone probe
+    return datetime.datetime.now(st.session_state.timezone or datetime.timezone.utc).isoformat()
+
+def load_timezone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return datetime.timezone.utc
+
+@st.cache_resource(show_spinner=False)
+def initialize_backend():
+    # Schema setup and metric exporters, once per process rather than on every script run
+    init_db()
+    start_exporters()
+
+def generate_assistant_response(generation):
     # region Timestamp Information
-    timestamp_placeholder = st.empty()
-    name = "AI Assistant"
-    timestamp = get_timestamp()
-    timestamp_placeholder.markdown(get_timestamp_string(name, timestamp))
+    st.markdown(get_timestamp_string(generation.name, generation.timestamp))
     # endregion
 
     # region Message Information
-    generated_response = ""
+    # Redraw at a throttled cadence rather than on every delta. A tick without new deltas still
+    # writes: Streamlit only notices a stop or a rerun request when the script sends something.
     message_placeholder = st.empty()
-    message_placeholder.markdown("▌")
-    for line in response.iter_lines():
-        if line:
-            decoded_line = line.decode("utf-8")
-
-            if decoded_line.startswith("data: "):
-                data = decoded_line[6:]
-                if data == "[DONE]":
-                    break
-                try:
-                    json_data = json.loads(data)
-                    error = json_data.get("error")
-                    if error is not None:
-                        st.session_state.generating_response = False
-                        st.session_state.input_error_message = {
-                            "title": "**❌ Error**",
-                            "subtitle": "",
-                            "message": "Please enter a message or upload a file before sending."
-                        }
-                        st.rerun()
-                    else:
-                        choices = json_data.get("choices")
-                        if is_list_not_empty(choices):
-                            message_delta = choices[0].get("delta")
-                            if "content" in message_delta:
-                                generated_response += message_delta.get("content") or ""
-                                message_placeholder.markdown(f"{generated_response}▌")
-                except json.JSONDecodeError as ex:
-                    st.session_state.generating_response = False
-                    st.session_state.input_error_message = {
-                        "title": "**❌ Streaming Error**",
-                        "subtitle": "",
-                        "message": f"JSON decode error: {ex}"
-                    }
-                    st.rerun()
-                except KeyError as ex:
-                    st.session_state.generating_response = False
-                    st.session_state.input_error_message = {
-                        "title": "**❌ Streaming Error**",
-                        "subtitle": "",
-                        "message": f"Missing key: {ex}"
-                    }
-                    st.rerun()
-                except Exception as ex:
-                    st.session_state.generating_response = False
-                    st.session_state.input_error_message = {
-                        "title": "**❌ Streaming Error**",
-                        "subtitle": "",
-                        "message": str(ex)
-                    }
-                    st.rerun()
-    message_placeholder.markdown(generated_response)
-    st.session_state.messages.append({"role": ASSISTANT, "content": generated_response, "name": name, "timestamp": timestamp})
-    save_message_into_session(session_id, ASSISTANT, name, generated_response, timestamp)
+    message_placeholder.markdown(f"{generation.text}▌")
+    seen_deltas = len(generation.deltas)
+    while not generation.done:
+        seen_deltas = generation.wait_for_update(seen_deltas)
+        message_placeholder.markdown(f"{generation.text}▌")
+    message_placeholder.markdown(generation.text)
     # endregion
 
 def display_error_message(error_title, error_subtitle = "", error_message = ""):
@@ -124,7 +104,11 @@ def display_error_message(error_title, error_subtitle = "", error_message = ""):
 def is_list_not_empty(list):
     return list is not None and len(list) > 0
 
-def display_messages(text, files, name, timestamp):
+def get_message_key(role, message_id=None, timestamp=None):
+    # Stable across reruns, so Streamlit keeps the same elements instead of replacing them
+    return f"{role}-{message_id}" if message_id is not None else f"{role}-{timestamp}"
+
+def display_messages(text, files, name, timestamp, key):
     # region Timestamp Information
     st.markdown(get_timestamp_string(name, timestamp))
     # endregion
@@ -136,45 +120,69 @@ def display_messages(text, files, name, timestamp):
     
     # region File Information
     if is_list_not_empty(files):
-        display_files(files)
+        display_files(files, key)
     # endregion
 
-def display_files(files):
-    for file in files:
+def on_toggle_full_size_image(image_key):
+    expanded_images = st.session_state.expanded_images
+    if image_key in expanded_images:
+        expanded_images.remove(image_key)
+    else:
+        expanded_images.add(image_key)
+
+def display_image(digest, load_data, filename, image_key):
+    # Large images are shown as a cached thumbnail, the full size only when asked for
+    thumbnail = get_thumbnail(digest, load_data)
+    if thumbnail is None:
+        st.image(load_data(), caption=filename)
+        return
+    is_expanded = image_key in st.session_state.expanded_images
+    st.image(load_data() if is_expanded else thumbnail, caption=filename)
+    st.button(
+        "🔎 Show thumbnail" if is_expanded else "🔍 View full size",
+        key=f"{image_key}-toggle",
+        on_click=on_toggle_full_size_image,
+        args=(image_key,)
+    )
+
+def display_files(files, key):
+    for index, file in enumerate(files):
+        file_key = f"{key}-file-{index}"
         if isinstance(file, dict):
             # region If file is from DB / history
             filename = file.get("name")
             mimetype = file.get("mimetype")
-            data = file.get("data")
-            if mimetype and mimetype.startswith("image/"):
-                img_bytes = base64.b64decode(data)
-                st.image(io.BytesIO(img_bytes), caption=filename)
+            if file.get("hash"):
+                # Blob is only loaded from the attachment store when it is needed
+                digest = file.get("hash")
+                load_data = lambda digest=digest: fetch_attachment(digest) or b""
             else:
-                st.download_button(
-                    label=f"Download {filename}",
-                    data=base64.b64decode(data),
-                    file_name=filename,
-                    mime=mimetype,
-                    key=str(uuid.uuid4())
-                )
+                # Legacy rows keep base64 data inline
+                file_data = base64.b64decode(file.get("data"))
+                digest = hash_content(file_data)
+                load_data = lambda file_data=file_data: file_data
             # endregion
         else:
             # region If file is from File Upload
             filename = file.name
             mimetype = file.type
             file_data = file.getvalue()
-            if mimetype and mimetype.startswith("image/"):
-                st.image(io.BytesIO(file_data), caption=filename)
-            else:
-                st.download_button(
-                    label=f"Download {filename}",
-                    data=file_data,
-                    file_name=filename,
-                    mime=mimetype,
-                    key=str(uuid.uuid4())
-                )
+            digest = hash_content(file_data)
+            load_data = lambda file_data=file_data: file_data
             # endregion
 
+        if mimetype and mimetype.startswith("image/"):
+            display_image(digest, load_data, filename, file_key)
+        else:
+            st.download_button(
+                label=f"Download {filename}",
+                data=load_data,  # Read only when the button is clicked
+                file_name=filename,
+                mime=mimetype,
+                key=file_key,
+                on_click="ignore"
+            )
+
 def get_input_content(text, files):
     input_content = []
 
@@ -188,46 +196,75 @@ def get_input_content(text, files):
 
     # region Add File to input
     if is_list_not_empty(files):
-        for file in files:
-            mime_type, _ = mimetypes.guess_type(file.name)
-            
-            # region Read and Encode Content to base64
-            file_content = file.read()
-            base64_data = base64.b64encode(file_content).decode("utf-8")
-            file_data = f"data:{mime_type};base64,{base64_data}"
-            file.seek(0)
+        import mimetypes  # Only needed once files are sent
+        attachments = [(file.name, mimetypes.guess_type(file.name)[0], file.getvalue()) for file in files]
+        input_content += get_attachments_content(attachments)
+    # endregion
+
+    return input_content
+
+def get_stored_input_content(message):
+    # Input content of a saved user message, its attachments read back from the database
+    input_content = [{"type": "text", "text": message.get("content")}] if message.get("content") else []
+    attachments = [
+        (file.get("name"), file.get("mimetype"), fetch_attachment(file.get("hash")))
+        for file in message.get("files") or []
+    ]
+    return input_content + get_attachments_content([attachment for attachment in attachments if attachment[2] is not None])
+
+def get_attachments_content(attachments):
+    # attachments: list of (name, mimetype, data)
+    input_content = []
+    for attachment in preprocess_attachments(attachments):
+        mime_type = attachment.get("mimetype")
+
+        if "text" in attachment:
+            # region PDF converted to text locally
+            input_content.append({
+                "type": "text",
+                "text": f"[Contents of {attachment.get('name')}]\n{attachment.get('text')}"
+            })
+            continue
             # endregion
 
-            if mime_type == "application/pdf":
-                input_content.append({
-                    "type": "file",
-                    "file": {
-                        "filename": file.name,
-                        "file_data": file_data
-                    }
-                })
-            else:
-                input_content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": file_data
-                    }
-                })
-    # endregion
+        # Encoded to base64 chunk by chunk while the request body is streamed
+        file_data = Base64DataUri(mime_type, attachment.get("data"))
 
+        if mime_type == "application/pdf":
+            input_content.append({
+                "type": "file",
+                "file": {
+                    "filename": attachment.get("name"),
+                    "file_data": file_data
+                }
+            })
+        else:
+            input_content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": file_data
+                }
+            })
     return input_content
     
 def get_input_headers():
     return {"Authorization": f"Bearer {st.secrets.get('OPEN_ROUTER_API_KEY')}"}
 
-def get_input_data(input_content):
+def get_input_messages(input_content, history):
     user_message = { "role": USER, "content": input_content }
-    return json.dumps({
-        "model": MODEL,
-        "messages": [user_message],
+    return build_context_messages(session_id, history, user_message)
+
+def get_input_data(messages, model):
+    return JsonStreamBody({
+        "model": model,
+        "messages": messages,
         "stream": True
     })
 
+def get_assistant_name(model):
+    # With several models configured, the answering one is kept with the message
+    return ASSISTANT_NAME if len(MODELS) == 1 else f"{ASSISTANT_NAME} ({model})"
+
 def styling_user_role():
     cssUserChat = """
     [class*="st-key-user"] .stChatMessage {
@@ -249,46 +286,90 @@ def get_timestamp_string(name, timestamp):
 def get_role_avatar(role):
     return "assets/user.png" if role == USER else "assets/ai_assistant.png"
 
-def generate_chat_input(text, files):
-    name = "User"
-    role = USER
-    input_content = get_input_content(text, files)
+def start_assistant_message(session_id, name):
+    # Created before the first token, so whatever streams in is saved even if the process stops
     timestamp = get_timestamp()
+    return start_message(session_id, ASSISTANT, name, timestamp), timestamp
+
+def rerun_with_storage_error(empty_space):
+    # A message could not be saved, most often because another tab deleted the session
+    empty_space.empty() # Hide Loading Component
+    st.session_state.generating_response = False
+    st.session_state.input_error_message = {
+        "title": "**❌ Error**",
+        "subtitle": "",
+        "message": "The message could not be saved. The session may have been deleted in another tab."
+    }
+    st.rerun()
+
+def get_generation_callbacks(session_id, message_id, response_cache_key=None):
+    # Run on the generation thread: checkpoints while streaming, then the final text and status
+    def on_checkpoint(partial_response):
+        checkpoint_message(session_id, message_id, partial_response)
+
+    def on_complete(generated_response):
+        finish_message(session_id, message_id, generated_response)
+        if response_cache_key is not None:
+            store_response(response_cache_key, generated_response)
+
+    def on_error(partial_response):
+        finish_message(session_id, message_id, partial_response, MESSAGE_FAILED)
+
+    return {"on_checkpoint": on_checkpoint, "on_complete": on_complete, "on_error": on_error}
+
+def load_session_history(session_id):
+    # Only the most recent window is loaded, unless earlier pages were requested
+    since_id = st.session_state.history_since_ids.get(session_id)
+    if since_id is None:
+        return fetch_chat_history(session_id, limit=HISTORY_PAGE_SIZE)
+    return fetch_chat_history(session_id, since_id=since_id, limit=None)
+
+def wait_for_generation_slot(scheduler, ticket, status):
+    # Shows the queue position while the message waits; False when it waited longer than MAX_QUEUE_WAIT
+    shown_position = 0
+    while not scheduler.wait(ticket, QUEUE_POLL_INTERVAL):
+        if time.perf_counter() - ticket.enqueued_at > MAX_QUEUE_WAIT:
+            return False
+        position = scheduler.get_position(ticket)
+        if position != shown_position:
+            status.update(label=f"Waiting for the AI assistant: number {position} in the queue...")
+            shown_position = position
+    if shown_position:
+        status.update(label=TYPING_LABEL)
+    return True
+
+def acquire_generation_slot(scheduler, ticket, empty_space):
+    # Waits behind any earlier message of this session; reruns with an error when the wait is too long
+    with empty_space.container():
+        with st.status(TYPING_LABEL, expanded=True) as status:
+            has_slot = wait_for_generation_slot(scheduler, ticket, status)
+    if not has_slot:
+        empty_space.empty() # Hide Loading Component
+        st.session_state.generating_response = False
+        st.session_state.input_error_message = {
+            "title": "**❌ Error**",
+            "subtitle": "",
+            "message": f"The AI assistant is busy and your message waited more than {MAX_QUEUE_WAIT:.0f} seconds for an answer. It is saved: press Continue to try again."
+        }
+        st.rerun()
 
-    with st.container(key=f"{role}-{str(uuid.uuid4())}"):
-        with st.chat_message(role, avatar=get_role_avatar(role)):
-            display_messages(text, files, name, timestamp)
-    
-    st.session_state.messages.append({
-        "role": role,
-        "content": text,
-        "files": [
-            {
-                "name": file.name,
-                "mimetype": file.type,
-                "data": base64.b64encode(file.getvalue()).decode("utf-8")
-            } for file in files
-        ] if files else [],
-        "name": name,
-        "timestamp": timestamp
-    })
-    save_message_into_session(session_id, USER, name, text, timestamp, files)
+def request_chat_completion(input_messages, empty_space):
+    # Returns the route of a streaming response; any failure is shown after a rerun instead.
+    # The HTTP client and the router are loaded with the first message, not on page load.
+    import requests
+    from api.routing import route_chat_completion
 
     # region Create a request to the server
     exception_occurred = False
     error_message = ""
-    response = None
+    route = None
 
-    empty_space = st.empty()
     with empty_space.container():
-        with st.status("Please wait, the AI assistant is typing a message...", expanded=True):
+        with st.status(TYPING_LABEL, expanded=True):
             try:
-                response = requests.post(
-                    url=BASE_URL,
+                route = route_chat_completion(
                     headers=get_input_headers(),
-                    data=get_input_data(input_content),
-                    stream=True,
-                    timeout=30
+                    build_data=lambda model: get_input_data(input_messages, model)
                 )
             except requests.ConnectionError:
                 exception_occurred = True
@@ -299,11 +380,11 @@ def generate_chat_input(text, files):
             except requests.RequestException as e:
                 exception_occurred = True
                 error_message = str(e)
+    empty_space.empty() # Hide Loading Component
     # endregion
 
     # region Retrieve a response
     if exception_occurred:
-        empty_space.empty() # Hide Loading Component
         st.session_state.generating_response = False
         st.session_state.input_error_message = {
             "title": "**❌ Error**",
@@ -311,19 +392,9 @@ def generate_chat_input(text, files):
             "message": error_message
         }
         st.rerun()
-    elif response is not None:
-        empty_space.empty() # Hide Loading Component
-
-        if response.status_code == 200:
-            # region Show Success Response from Assistant
-            role = ASSISTANT
-            with st.container(key=f"{role}-{str(uuid.uuid4())}"):
-                with st.chat_message(role, avatar=get_role_avatar(role)):
-                    generate_assistant_response(response)
-                    st.session_state.generating_response = False
-                    st.rerun() # Rerun to reset the state of new session creation
-            # endregion
-        else:
+    elif route is not None:
+        response = route.response
+        if response.status_code != 200:
             # region Show Error Response when status code retrieved from API is not succeed
             error_json = json.loads(response.text)
             error = error_json.get("error")
@@ -338,15 +409,202 @@ def generate_chat_input(text, files):
             }
             st.rerun()
             # endregion
+        return route
     else:
-        empty_space.empty() # Hide Loading Component
         st.session_state.generating_response = False
         st.rerun()
     # endregion
 
+def generate_chat_input(text, files):
+    submitted_at = time.perf_counter()  # Time to first token is measured from here
+    name = "User"
+    role = USER
+    input_content = get_input_content(text, files)
+    timestamp = get_timestamp()
+
+    message_key = get_message_key(role, timestamp=timestamp)
+    with st.container(key=message_key):
+        with st.chat_message(role, avatar=get_role_avatar(role)):
+            display_messages(text, files, name, timestamp, message_key)
+
+    # Saved before waiting for a slot, so the message outlives a queue timeout or a stopped run
+    empty_space = st.empty()
+    try:
+        saved_message, files_metadata = save_message_into_session(session_id, USER, name, text, timestamp, files)
+        user_message_id = saved_message.result()
+    except StorageError:
+        rerun_with_storage_error(empty_space)
+
+    # The ticket holds this session's place in line; whoever ends up owning it gives it back
+    scheduler = get_scheduler()
+    ticket = scheduler.submit(session_id)
+    on_finish = lambda: scheduler.release(ticket)
+    handed_off = False
+    assistant_message_id = None
+    try:
+        acquire_generation_slot(scheduler, ticket, empty_space)
+
+        # Read again now that the earlier answers of this session, from any tab, are saved.
+        # Those can come after this message, which goes last in the context instead.
+        history = load_session_history(session_id)
+        context_history = [message for message in history if message.get("id") != user_message_id]
+        input_messages = get_input_messages(input_content, context_history)
+        st.session_state.messages = history
+
+        # region Replay a cached response to an identical prompt
+        response_cache_key = None
+        if RESPONSE_CACHE_ENABLED:
+            response_cache_key = get_response_cache_key(
+                ",".join(MODELS), text, [file.get("hash") for file in files_metadata],
+                input_messages[:-1] # The prompt itself is keyed by its text and attachment hashes
+            )
+            cached_response = get_cached_response(response_cache_key)
+            if cached_response is not None:
+                try:
+                    assistant_message_id, assistant_timestamp = start_assistant_message(session_id, ASSISTANT_NAME)
+                except StorageError:
+                    rerun_with_storage_error(empty_space)
+                on_complete = get_generation_callbacks(session_id, assistant_message_id)["on_complete"]
+                start_replay(session_id, cached_response, ASSISTANT_NAME, assistant_timestamp, on_complete, on_finish, assistant_message_id)
+                handed_off = True
+                empty_space.empty() # Hide Loading Component
+                st.session_state.generating_response = False
+                st.rerun()
+        # endregion
+
+        route = request_chat_completion(input_messages, empty_space)
+
+        # region Stream the Response from Assistant in the background
+        assistant_name = get_assistant_name(route.model)
+        try:
+            assistant_message_id, assistant_timestamp = start_assistant_message(session_id, assistant_name)
+        except StorageError:
+            route.response.close()
+            rerun_with_storage_error(empty_space)
+        callbacks = get_generation_callbacks(session_id, assistant_message_id, response_cache_key)
+        start_generation(
+            session_id, route.response, assistant_name, assistant_timestamp, started_at=submitted_at, deltas=route.deltas,
+            on_finish=on_finish, message_id=assistant_message_id, **callbacks
+        )
+        handed_off = True
+        st.session_state.generating_response = False
+        st.rerun() # Rerun to release the controls while the response is streaming
+        # endregion
+    finally:
+        # Also runs when st.rerun() or a stopped script run leaves early
+        if not handed_off:
+            scheduler.release(ticket)
+            if assistant_message_id is None:
+                record_unanswered_message(session_id)
+
+def record_unanswered_message(session_id):
+    # The message never got an answer started: it gave up waiting for a slot, its request failed,
+    # or the run was stopped. An empty failed answer marks it, and its Continue button asks again.
+    try:
+        message_id, _ = start_assistant_message(session_id, ASSISTANT_NAME)
+        finish_message(session_id, message_id, "", MESSAGE_FAILED)
+    except StorageError:
+        pass # The session is gone
+
+def continue_assistant_message(message_id):
+    # Asks for the rest of an interrupted answer; the model is given the partial text as the start of its reply
+    submitted_at = time.perf_counter()
+    scheduler = get_scheduler()
+    ticket = scheduler.submit(session_id)
+    handed_off = False
+    try:
+        empty_space = st.empty()
+        acquire_generation_slot(scheduler, ticket, empty_space)
+
+        history = load_session_history(session_id)
+        if not history or history[-1].get("id") != message_id or history[-1].get("status") == MESSAGE_COMPLETE:
+            # Answered or followed up from another tab in the meantime
+            st.session_state.generating_response = False
+            st.rerun()
+        message = history[-1]
+        partial_response = message.get("content") or ""
+        if partial_response:
+            input_messages = build_context_messages(session_id, history[:-1], {"role": ASSISTANT, "content": partial_response})
+        else:
+            # Nothing was answered, so the question is asked again; answers to earlier messages can follow it
+            question_index = max((index for index, earlier in enumerate(history[:-1]) if earlier.get("role") == USER), default=None)
+            if question_index is None:
+                st.session_state.generating_response = False
+                st.rerun()
+            context_history = history[:question_index] + history[question_index + 1:-1]
+            input_messages = build_context_messages(session_id, context_history, {"role": USER, "content": get_stored_input_content(history[question_index])})
+
+        route = request_chat_completion(input_messages, empty_space)
+
+        # region Stream the rest of the answer into the same message
+        checkpoint_message(session_id, message_id, partial_response) # Back to streaming until the continuation ends
+        callbacks = get_generation_callbacks(session_id, message_id)
+        start_generation(
+            session_id, route.response, message.get("name"), message.get("timestamp"), started_at=submitted_at, deltas=route.deltas,
+            on_finish=lambda: scheduler.release(ticket), message_id=message_id, prefix=partial_response, **callbacks
+        )
+        handed_off = True
+        st.session_state.generating_response = False
+        st.rerun()
+        # endregion
+    finally:
+        if not handed_off:
+            scheduler.release(ticket)
+
+def on_continue_message(message_id):
+    st.session_state.pending_continuation = message_id
+    st.session_state.generating_response = True
+
+def display_unfinished_notice(message, message_key, can_continue):
+    # An answer that is not being streamed by this process but was never completed: it failed,
+    # or the process streaming it stopped. Its saved part is shown, with the option to continue.
+    if message.get("status") == MESSAGE_FAILED:
+        st.caption("⚠️ This answer stopped early because of an error.")
+    else:
+        st.caption("⚠️ This answer was interrupted before it finished.")
+    if can_continue:
+        st.button(
+            "▶️ Continue",
+            key=f"{message_key}-continue",
+            disabled=st.session_state.get("generating_response", False),
+            on_click=on_continue_message,
+            args=(message.get("id"),)
+        )
+
 def on_session_change():
     st.session_state.session_changed = True
 
+def on_load_earlier_messages(session_id, oldest_id):
+    earlier_page = fetch_chat_history(session_id, before_id=oldest_id, limit=HISTORY_PAGE_SIZE)
+    if earlier_page:
+        st.session_state.history_since_ids[session_id] = earlier_page[0].get("id")
+
+def on_select_search_result(session_id, message_id):
+    st.session_state.session_id = session_id
+    st.session_state.jump_to_session = True
+    # region Make sure the matched message is inside the loaded history
+    recent_messages = fetch_chat_history(session_id, limit=HISTORY_PAGE_SIZE)
+    if is_list_not_empty(recent_messages) and message_id < recent_messages[0].get("id"):
+        since_id = st.session_state.history_since_ids.get(session_id)
+        st.session_state.history_since_ids[session_id] = min(message_id, since_id) if since_id else message_id
+    # endregion
+
+def on_session_filter_change():
+    st.session_state.session_offset = 0
+
+def on_change_session_page(step):
+    st.session_state.session_offset = max(0, st.session_state.session_offset + step)
+
+def get_session_caption(session):
+    message_count = session.get("message_count") or 0
+    caption = f"{message_count} message{'s' if message_count != 1 else ''}"
+    if session.get("last_activity_at"):
+        last_activity = datetime.datetime.fromisoformat(session.get("last_activity_at"))
+        caption += f" · {last_activity.strftime('%d %b %Y %H.%M')}"
+    if session.get("title"):
+        caption = f"{session.get('title')}  \n{caption}"
+    return caption
+
 def on_session_name_input_change():
     st.session_state.add_new_session_error_message = ""
     st.session_state.session_name_error = False
@@ -359,15 +617,35 @@ def on_submit_chat_input():
 def show_delete_confirmation():
     st.write("Are you sure you want to delete all sessions? This action cannot be undone.")
     if st.button("Yes, delete all sessions", use_container_width=True):
-        delete_all_sessions()
+        delete_all_sessions(user_id=get_user_id())
         st.session_state.new_session = True
         st.session_state.create_new_session_error_message = ""
         st.session_state.session_name_error = False
         st.rerun()
 
+def forget_session(session_id):
+    st.session_state.pop("session_id", None)
+    st.session_state.history_since_ids.pop(session_id, None)
+    if "session_radio" in st.session_state:
+        del st.session_state["session_radio"]  # Recreated on the first remaining session
+
+@st.dialog("Confirm to Delete")
+def show_delete_session_confirmation(session_id, session_name):
+    st.write(f"Are you sure you want to delete the session **{session_name}**? This action cannot be undone.")
+    if st.button("Yes, delete this session", use_container_width=True):
+        delete_session(session_id, user_id=get_user_id())
+        forget_session(session_id)
+        st.rerun()
+
+def on_archive_session(session_id):
+    archive_path = archive_session(session_id, user_id=get_user_id())
+    forget_session(session_id)
+    if archive_path:
+        st.toast(f"Session archived to {archive_path}")
+
 def on_create_session(new_session_name, is_input_chat=False, text=None, files=None):
     if new_session_name:
-        if new_session_name in session_names:
+        if session_name_exists(new_session_name, user_id=get_user_id()):
             # region Check if session name already exists
             st.session_state.create_new_session_error_message = "Session name already exists. Please choose a different name."
             st.session_state.session_name_error = True
@@ -376,7 +654,7 @@ def on_create_session(new_session_name, is_input_chat=False, text=None, files=No
             # endregion
         else:
             # region Create a new session
-            session_id = create_session(new_session_name, get_timestamp())
+            session_id = create_session(new_session_name, get_timestamp(), user_id=get_user_id())
             st.session_state.create_new_session_error_message = ""
             st.session_state.session_id = session_id
             st.session_state.session_name_error = False
@@ -404,14 +682,29 @@ def on_create_session(new_session_name, is_input_chat=False, text=None, files=No
 
 # region Sidebar
 # region Session Selection / Creation
-init_db()
-sessions = get_sessions()
-session_names = [name for (_, name) in sessions]
-session_ids = [sid for (sid, _) in sessions]
+initialize_backend()
+any_sessions = has_sessions(user_id=get_user_id())
+
+# region Load one page of sessions, optionally filtered by name
+session_filter = st.session_state.get("session_filter", "").strip()
+sessions = get_sessions_page(limit=SESSION_PAGE_SIZE + 1, offset=st.session_state.session_offset, prefix=session_filter, user_id=get_user_id())
+has_older_sessions = len(sessions) > SESSION_PAGE_SIZE
+sessions = sessions[:SESSION_PAGE_SIZE]
+
+# The selected session stays listed even when it is on another page
+selected_session_id = st.session_state.get("session_id")
+if selected_session_id and selected_session_id not in [session.get("id") for session in sessions]:
+    selected_session = get_session(selected_session_id)
+    if selected_session is not None and selected_session.get("user_id") == get_user_id():
+        sessions.insert(0, selected_session)
+
+session_ids = [session.get("id") for session in sessions]
+sessions_by_id = {session.get("id"): session for session in sessions}
+# endregion
 
 # region Sidebar Header
 st.sidebar.title("💬 AI Chatbot App")
-st.sidebar.markdown(f"Powered by ```{MODEL}``` via OpenRouter 👾")
+st.sidebar.markdown(f"Powered by {', '.join(f'```{model}```' for model in MODELS)} via OpenRouter 👾")
 st.sidebar.markdown("Accepted file types to be uploaded: ```JPG```, ```JPEG```, ```PNG```, ```PDF``` and we can upload multiple files.")
 # endregion
 
@@ -420,7 +713,7 @@ st.sidebar.subheader("Chat Sessions")
 
 # region Sidebar Layout
 if st.session_state.new_session:
-    if is_list_not_empty(sessions):
+    if any_sessions:
         if st.sidebar.button(
             "⬅️ Back", 
             key="back_to_sessions", 
@@ -459,18 +752,71 @@ else:
     ):
         show_delete_confirmation()
 
-    selected_idx = st.sidebar.radio(
+    # region Search Messages
+    search_query = st.sidebar.text_input(
+        "Search messages",
+        key="search_query",
+        placeholder="Search messages in all sessions"
+    )
+    if search_query:
+        search_results = search_messages(search_query, limit=SEARCH_RESULTS_LIMIT, user_id=get_user_id())
+        if not search_results:
+            st.sidebar.caption("No messages found.")
+        for result in search_results:
+            st.sidebar.button(
+                f"**{result.get('session_name')}**: {result.get('snippet')}",
+                key=f"search_result_{result.get('message_id')}",
+                use_container_width=True,
+                on_click=on_select_search_result,
+                args=(result.get("session_id"), result.get("message_id")),
+                disabled=st.session_state.get("generating_response", False)
+            )
+    # endregion
+
+    # region Select the session of a search result in the Radio Button
+    if st.session_state.pop("jump_to_session", False) and "session_radio" in st.session_state:
+        del st.session_state["session_radio"]  # Recreated from the index of the selected session
+    # endregion
+
+    # region Session List Filter and Paging
+    st.sidebar.text_input(
+        "Find a session",
+        key="session_filter",
+        on_change=on_session_filter_change,
+        placeholder="Filter sessions by name"
+    )
+    previous_column, next_column = st.sidebar.columns(2)
+    previous_column.button(
+        "◀ Newer",
+        key="newer_sessions",
+        use_container_width=True,
+        disabled=st.session_state.session_offset == 0,
+        on_click=on_change_session_page,
+        args=(-SESSION_PAGE_SIZE,)
+    )
+    next_column.button(
+        "Older ▶",
+        key="older_sessions",
+        use_container_width=True,
+        disabled=not has_older_sessions,
+        on_click=on_change_session_page,
+        args=(SESSION_PAGE_SIZE,)
+    )
+    # endregion
+
+    selected_session_id = st.sidebar.radio(
         "Select a session",
-        options=list(range(len(session_names))),
-        format_func=lambda i: session_names[i],
-        index=session_ids.index(st.session_state.get("session_id", session_ids[0])) if session_ids else 0,
+        options=session_ids,
+        format_func=lambda sid: sessions_by_id[sid].get("name"),
+        captions=[get_session_caption(sessions_by_id[sid]) for sid in session_ids],
+        index=session_ids.index(st.session_state.session_id) if st.session_state.get("session_id") in session_ids else 0,
         key="session_radio",
         on_change=on_session_change,
         disabled=st.session_state.get("generating_response", False)
     )
     # region Handle Session Selection Change from Radio Button
-    if selected_idx is not None and len(session_ids) > 0:
-        st.session_state.session_id = session_ids[selected_idx]
+    if selected_session_id is not None and len(session_ids) > 0:
+        st.session_state.session_id = selected_session_id
     else:
         st.session_state.session_id = session_ids[0] if session_ids else 0
     if st.session_state.get("session_changed"):
@@ -478,21 +824,54 @@ else:
         st.rerun()
     # endregion
 
+    # region Archive or Delete the Selected Session
+    if selected_session_id is not None:
+        session_busy = st.session_state.get("generating_response", False) or is_generating(selected_session_id)
+        archive_column, delete_column = st.sidebar.columns(2)
+        archive_column.button(
+            "📦 Archive",
+            key="archive_session",
+            use_container_width=True,
+            disabled=session_busy,
+            on_click=on_archive_session,
+            args=(selected_session_id,)
+        )
+        if delete_column.button(
+            "🗑️ Delete",
+            key="delete_session",
+            use_container_width=True,
+            disabled=session_busy
+        ):
+            show_delete_session_confirmation(selected_session_id, sessions_by_id[selected_session_id].get("name"))
+    # endregion
+
+# endregion
+
+# region Metrics Debug Panel
+if METRICS_ENABLED and METRICS_DEBUG_PANEL:
+    with st.sidebar.expander("📈 Metrics"):
+        st.table([{"metric": name, **values} for name, values in get_snapshot().items()])
+        if len(MODELS) > 1:
+            from api.routing import get_model_stats
+            st.caption(f"Model routing: {ROUTING_MODE}")
+            st.table([{"model": model, **stats} for model, stats in get_model_stats().items()])
 # endregion
 
 # region Initialize Session Data
-if is_list_not_empty(sessions):
+if any_sessions:
     # set selected session ID based on the initial value of Radio Button
     if not st.session_state.new_session and "session_id" not in st.session_state:
-        st.session_state.session_id = session_ids[0]
+        st.session_state.session_id = session_ids[0] if session_ids else 0
 else:
     st.session_state.new_session = True
 # endregion
 
 # region Load messages for the current session
 session_id = st.session_state.get("session_id")
+# Looked up before the history so a generation finishing in between is never missed
+active_generation = get_generation(session_id) if session_id else None
 if session_id:
-    st.session_state.messages = fetch_chat_history(session_id)
+    st.session_state.messages = load_session_history(session_id)
 else:
     st.session_state.messages = []
 # endregion
@@ -507,12 +886,36 @@ styling_user_role()
 
 # region State Initialization after re-rendering
 
+# region Load Earlier Messages
+if session_id and is_list_not_empty(st.session_state.messages):
+    oldest_id = st.session_state.messages[0].get("id")
+    if oldest_id is not None and has_earlier_messages(session_id, oldest_id):
+        st.button(
+            "⬆️ Load earlier messages",
+            key="load_earlier_messages",
+            use_container_width=True,
+            disabled=st.session_state.get("generating_response", False),
+            on_click=on_load_earlier_messages,
+            args=(session_id, oldest_id)
+        )
+# endregion
+
 # region Displayed Messages
-for message in st.session_state.messages:
-    role = message.get("role")
-    with st.container(key=f"{role}-{str(uuid.uuid4())}"):
-        with st.chat_message(role, avatar=get_role_avatar(role)):
-            display_messages(message.get("content"), message.get("files", []), message.get("name"), message.get("timestamp"))
+# The answer being streamed is drawn live below the history instead
+live_message_id = active_generation.message_id if active_generation is not None else None
+with render_history_seconds.time():
+    for index, message in enumerate(st.session_state.messages):
+        if live_message_id is not None and message.get("id") == live_message_id:
+            continue
+        role = message.get("role")
+        message_key = get_message_key(role, message.get("id"), message.get("timestamp"))
+        with st.container(key=message_key):
+            with st.chat_message(role, avatar=get_role_avatar(role)):
+                display_messages(message.get("content"), message.get("files", []), message.get("name"), message.get("timestamp"), message_key)
+                if message.get("status", MESSAGE_COMPLETE) != MESSAGE_COMPLETE:
+                    # Only the last answer can be continued, and not while another one streams
+                    can_continue = index == len(st.session_state.messages) - 1 and active_generation is None
+                    display_unfinished_notice(message, message_key, can_continue)
 # endregion
 
 # region Handle Pending Message from sending a message while creating a new session
@@ -522,6 +925,13 @@ if "pending_message" in st.session_state:
         generate_chat_input(pending.get("text", ""), pending.get("files", []))
 # endregion
 
+# region Handle Continue on an interrupted answer
+if "pending_continuation" in st.session_state:
+    pending_message_id = st.session_state.pop("pending_continuation", None)
+    if pending_message_id is not None:
+        continue_assistant_message(pending_message_id)
+# endregion
+
 if "input_error_message" in st.session_state and st.session_state.input_error_message:
     input_error = st.session_state.input_error_message
     display_error_message(input_error.get("title", ""), input_error.get("subtitle", ""), input_error.get("message", ""))
@@ -531,7 +941,7 @@ user_input = st.chat_input(
     "Input your message here", 
     accept_file="multiple", 
     file_type=ACCEPTED_FILE_TYPES,
-    disabled=st.session_state.get("generating_response", False),
+    disabled=st.session_state.get("generating_response", False) or is_generating(session_id),
     on_submit=on_submit_chat_input
 )
 
@@ -557,4 +967,28 @@ if user_input is not None:
         else:
             st.session_state.pending_message = {"text": text, "files": files}
             st.rerun()
-# endregion
\ No newline at end of file
+
+render_page_seconds.observe(time.perf_counter() - script_started_at)
+
+# region Probe the browser timezone after the page is drawn, once per session
+if st.session_state.timezone is None:
+    timezone_name = st_javascript("""await (async () => {
+            const userTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+            return userTimezone
+})().then(returnValue => returnValue)""")
+    if timezone_name:  # 0 until the browser answers, which reruns the script
+        st.session_state.timezone = load_timezone(timezone_name)
+# endregion
+
+# region Stream the active response of the current session
+if active_generation is not None:
+    role = ASSISTANT
+    with st.container(key=f"{get_message_key(role, timestamp=active_generation.timestamp)}-live"):
+        with st.chat_message(role, avatar=get_role_avatar(role)):
+            generate_assistant_response(active_generation)
+    if active_generation.error is not None:
+        discard_generation(session_id, active_generation)
+        st.session_state.input_error_message = active_generation.error
+    st.rerun()
+# endregion
+# endregion
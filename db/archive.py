@@ -0,0 +1,50 @@
+import base64
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+ARCHIVE_DIR = os.environ.get("CHAT_ARCHIVE_DIR", "archives")
+
+def iter_session_records(session, messages, load_attachment):
+    # One JSON-ready record for the session, then one per message with attachment data inlined.
+    # load_attachment(hash) returns the blob, or None when it is missing.
+    yield {
+        "type": "session",
+        "id": session.get("id"),
+        "user_id": session.get("user_id"),
+        "name": session.get("name"),
+        "created_at": session.get("created_at")
+    }
+    for message in messages:
+        files_metadata = [dict(file) for file in message.get("files") or []]
+        for file in files_metadata:
+            if file.get("hash"):
+                blob = load_attachment(file.get("hash"))
+                file["data"] = base64.b64encode(blob).decode("utf-8") if blob is not None else None
+        yield {
+            "type": "message",
+            "id": message.get("id"),
+            "session_id": session.get("id"),
+            "role": message.get("role"),
+            "name": message.get("name"),
+            "content": message.get("content"),
+            "files": files_metadata,
+            "timestamp": message.get("timestamp"),
+            "status": message.get("status")
+        }
+
+def write_session_archive(records, session_id, archive_dir=None):
+    # Streams the records into <archive_dir>/session-<id>-<time>-<suffix>.jsonl.gz and returns the path.
+    # Session ids come back after a database reset, so the id alone would overwrite an older archive.
+    archive_dir = archive_dir or ARCHIVE_DIR
+    os.makedirs(archive_dir, exist_ok=True)
+    archived_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(archive_dir, f"session-{session_id}-{archived_at}-{uuid.uuid4().hex[:8]}.jsonl.gz")
+    temporary_path = f"{path}.tmp"
+    with gzip.open(temporary_path, "wt", encoding="utf-8") as archive:
+        for record in records:
+            archive.write(json.dumps(record) + "\n")
+    os.replace(temporary_path, path)  # A crash never leaves a truncated archive behind
+    return path
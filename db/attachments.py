@@ -0,0 +1,63 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from db.connection import get_connection
+
+# Blobs are immutable per hash, so recently shown ones are kept in memory up to this many bytes
+MAX_CACHED_ATTACHMENT_BYTES = 64 * 1024 * 1024
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+def hash_content(data):
+    return hashlib.sha256(data).hexdigest()
+
+def create_attachments_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            hash TEXT PRIMARY KEY,
+            mimetype TEXT,
+            size INTEGER,
+            data BLOB
+        )
+    """)
+
+def store_attachment(conn, data, mimetype, digest=None):
+    # Content-addressed: identical uploads share a single row
+    digest = digest or hash_content(data)
+    conn.execute(
+        "INSERT OR IGNORE INTO attachments (hash, mimetype, size, data) VALUES (?, ?, ?, ?)",
+        (digest, mimetype, len(data), data)
+    )
+    return digest
+
+def get_cached_attachment(digest):
+    with _cache_lock:
+        data = _cache.get(digest)
+        if data is not None:
+            _cache.move_to_end(digest)
+        return data
+
+def cache_attachment(digest, data):
+    global _cache_bytes
+    if len(data) > MAX_CACHED_ATTACHMENT_BYTES:
+        return
+    with _cache_lock:
+        if digest not in _cache:
+            _cache[digest] = data
+            _cache_bytes += len(data)
+        while _cache_bytes > MAX_CACHED_ATTACHMENT_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+def fetch_attachment(digest):
+    data = get_cached_attachment(digest)
+    if data is not None:
+        return data
+    with get_connection() as conn:
+        row = conn.execute("SELECT data FROM attachments WHERE hash=?", (digest,)).fetchone()
+    if row is None:
+        return None
+    cache_attachment(digest, row[0])
+    return row[0]
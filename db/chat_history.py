@@ -1,101 +1,174 @@
-import json
-import base64
-import sqlite3
+import os
+import threading
 from datetime import datetime
+from db.attachments import hash_content
+from db.archive import iter_session_records, write_session_archive
+from db.storage import MESSAGE_STREAMING, MESSAGE_COMPLETE
+from db.transfer import write_records, read_records, iter_import_batches
+from monitoring.metrics import timed
 
-DB_FILE = "chat_history.db"
+# region Settings (overridable through environment variables)
+STORAGE_BACKEND = os.environ.get("CHAT_STORAGE_BACKEND", "sqlite")  # "sqlite" or "postgres"
+DEFAULT_USER_ID = ""  # Owner of every session when the app runs without sign-in
+# endregion
+
+HISTORY_PAGE_SIZE = 50
+SESSION_PAGE_SIZE = 20
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    # One backend instance per process, chosen by CHAT_STORAGE_BACKEND
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "sqlite":
+                    from db.sqlite_storage import SQLiteStorage
+                    _storage = SQLiteStorage()
+                elif STORAGE_BACKEND == "postgres":
+                    from db.postgres_storage import PostgresStorage
+                    _storage = PostgresStorage()
+                else:
+                    raise ValueError(f"Unknown CHAT_STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
+
+def timed_query(query):
+    return timed("db_query_seconds", "Latency of chat history calls, waiting for queued writes included", {"query": query})
 
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            created_at TEXT
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER,
-            role TEXT,
-            name TEXT,
-            content TEXT,
-            files TEXT,
-            timestamp TEXT,
-            FOREIGN KEY(session_id) REFERENCES sessions(id)
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def create_session(name, timestamp=None):
+    get_storage().init()
+
+@timed_query("create_session")
+def create_session(name, timestamp=None, user_id=DEFAULT_USER_ID):
     if timestamp is None:
         timestamp = datetime.now().isoformat()
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO sessions (name, created_at) VALUES (?, ?)",
-        (name, timestamp)
-    )
-    session_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return session_id
-
-def get_sessions():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT id, name FROM sessions ORDER BY created_at DESC")
-    sessions = c.fetchall()
-    conn.close()
-    return sessions
+    return get_storage().create_session(user_id, name, timestamp)
+
+@timed_query("get_sessions")
+def get_sessions(user_id=DEFAULT_USER_ID):
+    return get_storage().get_sessions(user_id)
+
+@timed_query("get_sessions_page")
+def get_sessions_page(limit=SESSION_PAGE_SIZE, offset=0, prefix=None, user_id=DEFAULT_USER_ID):
+    # Newest sessions of the user first; prefix filters names case-insensitively
+    return get_storage().get_sessions_page(user_id, limit, offset, prefix)
 
+@timed_query("get_session")
+def get_session(session_id):
+    return get_storage().get_session(session_id)
+
+@timed_query("has_sessions")
+def has_sessions(user_id=DEFAULT_USER_ID):
+    return get_storage().has_sessions(user_id)
+
+@timed_query("session_name_exists")
+def session_name_exists(name, user_id=DEFAULT_USER_ID):
+    return get_storage().session_name_exists(user_id, name)
+
+@timed_query("save_message_into_session")
 def save_message_into_session(session_id, role, name, content, timestamp=None, files=None):
-    files_json = None
-    if files:
-        # files: list of file-like objects (from Streamlit uploader)
-        files_json = json.dumps([
-            {
-                "name": file.name,
-                "mimetype": file.type,
-                "data": base64.b64encode(file.getvalue()).decode("utf-8")
-            }
-            for file in files
-        ])
+    # files: list of file-like objects (from Streamlit uploader)
+    # Returns (Future of the message id, file metadata), each metadata entry referencing its blob by hash.
+    # The future fails with StorageError when the write is refused.
+    if timestamp is None:
+        timestamp = datetime.now().isoformat()
+    attachments = []
+    files_metadata = []
+    for file in files or []:
+        data = file.getvalue()
+        digest = hash_content(data)
+        attachments.append((data, file.type, digest))
+        files_metadata.append({
+            "name": file.name,
+            "mimetype": file.type,
+            "hash": digest,
+            "size": len(data)
+        })
+    saved = get_storage().save_message(session_id, role, name, content, timestamp, files_metadata, attachments)
+    return saved, files_metadata
+
+@timed_query("start_message")
+def start_message(session_id, role, name, timestamp=None):
+    # Creates the message before its content exists, so a streamed answer is saved as it arrives.
+    # Returns the message id for checkpoint_message and finish_message; raises StorageError when refused.
     if timestamp is None:
         timestamp = datetime.now().isoformat()
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO messages (session_id, role, name, content, files, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-        (session_id, role, name, content, files_json, timestamp)
-    )
-    conn.commit()
-    conn.close()
-
-def fetch_chat_history(session_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT role, name, content, files, timestamp FROM messages WHERE session_id=? ORDER BY id ASC", (session_id,))
-    rows = c.fetchall()
-    conn.close()
-    return [
-        {
-            "role": r, 
-            "name": n, 
-            "content": c, 
-            "files": json.loads(f) if f else [], 
-            "timestamp": t
-        } 
-        for r, n, c, f, t in rows
-    ]
-
-def delete_all_sessions():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM sessions")
-    c.execute("DELETE FROM messages")
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    return get_storage().start_message(session_id, role, name, timestamp)
+
+def checkpoint_message(session_id, message_id, content):
+    # Saves the text streamed so far; the message stays MESSAGE_STREAMING
+    get_storage().update_message(session_id, message_id, content, MESSAGE_STREAMING)
+
+def finish_message(session_id, message_id, content, status=MESSAGE_COMPLETE):
+    get_storage().update_message(session_id, message_id, content, status)
+
+@timed_query("fetch_chat_history")
+def fetch_chat_history(session_id, before_id=None, limit=HISTORY_PAGE_SIZE, since_id=None):
+    # Keyset pagination over (session_id, id): returns the newest `limit` messages
+    # older than before_id and not older than since_id, in chronological order.
+    # limit=None returns every matching message.
+    return get_storage().fetch_chat_history(session_id, before_id, limit, since_id)
+
+@timed_query("has_earlier_messages")
+def has_earlier_messages(session_id, before_id):
+    return get_storage().has_earlier_messages(session_id, before_id)
+
+@timed_query("search_messages")
+def search_messages(query, limit=20, offset=0, user_id=DEFAULT_USER_ID):
+    # Newest matches in the user's sessions first; snippets mark the matched words in bold markdown
+    return get_storage().search_messages(user_id, query, limit, offset)
+
+def fetch_attachment(digest):
+    return get_storage().fetch_attachment(digest)
+
+@timed_query("delete_session")
+def delete_session(session_id, user_id=DEFAULT_USER_ID):
+    get_storage().delete_session(user_id, session_id)
+
+@timed_query("archive_session")
+def archive_session(session_id, archive_dir=None, user_id=DEFAULT_USER_ID):
+    # Writes the session to a compressed JSONL file, then deletes it from the database.
+    # Returns the archive path, or None if the user has no such session.
+    storage = get_storage()
+    session = storage.get_session(session_id)
+    if session is None or session.get("user_id") != user_id:
+        return None
+    records = iter_session_records(session, storage.iter_session_messages(session_id), storage.fetch_attachment)
+    path = write_session_archive(records, session_id, archive_dir)
+    storage.delete_session(user_id, session_id)
+    return path
+
+@timed_query("delete_all_sessions")
+def delete_all_sessions(user_id=DEFAULT_USER_ID):
+    get_storage().delete_all_sessions(user_id)
+
+@timed_query("export_sessions")
+def export_sessions(path, user_id=None):
+    # Streams sessions (every user's when user_id is None) and their messages into a JSONL file.
+    # Returns (sessions, messages) written.
+    storage = get_storage()
+    counts = {"session": 0, "message": 0}
+
+    def iter_records():
+        for session in storage.iter_sessions(user_id):
+            records = iter_session_records(session, storage.iter_session_messages(session.get("id")), storage.fetch_attachment)
+            for record in records:
+                counts[record["type"]] += 1
+                yield record
+
+    write_records(iter_records(), path)
+    return counts["session"], counts["message"]
+
+@timed_query("import_sessions")
+def import_sessions(path, user_id=None):
+    # Adds the sessions of an export as new sessions, in large batched transactions.
+    # user_id, when given, takes every session over. Returns (sessions, messages) imported.
+    storage = get_storage()
+    session_ids = {}
+    message_count = 0
+    for sessions, messages in iter_import_batches(read_records(path), user_id, DEFAULT_USER_ID):
+        storage.import_batch(sessions, messages, session_ids)
+        message_count += len(messages)
+    return len(session_ids), message_count
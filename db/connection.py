@@ -0,0 +1,82 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_FILE = "chat_history.db"
+
+# Statements kept compiled per connection, so repeated queries skip re-preparing
+STATEMENT_CACHE_SIZE = 256
+
+# Idle connections kept open for reuse; a busier moment opens extra ones, closed on return
+POOL_SIZE = 8
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",     # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",   # 256 MB memory-mapped I/O
+)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)  # (db_file, conn); the most recently used has the warmest cache
+_init_lock = threading.Lock()
+_initialized_files = set()
+
+def _open_connection(db_file):
+    # Connections move between threads through the pool, but only one thread uses one at a time
+    conn = sqlite3.connect(db_file, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _checkout():
+    # Returns (db_file, conn)
+    while True:
+        try:
+            db_file, conn = _pool.get_nowait()
+        except queue.Empty:
+            return DB_FILE, _open_connection(DB_FILE)
+        if db_file == DB_FILE:
+            return db_file, conn
+        conn.close()  # Left over from before DB_FILE changed
+
+def _checkin(db_file, conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait((db_file, conn))
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def get_connection():
+    # Streamlit runs every rerun on a new script thread, so connections are shared process-wide:
+    # each operation checks one out of the pool and returns it, keeping its pragmas,
+    # compiled statements and page cache for the next rerun.
+    db_file, conn = _checkout()
+    try:
+        yield conn
+    finally:
+        _checkin(db_file, conn)
+
+def close_connections():
+    # Closes the idle pooled connections
+    while True:
+        try:
+            _, conn = _pool.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
+
+def run_once(setup):
+    # Run setup(conn) a single time per process and database file
+    if DB_FILE in _initialized_files:
+        return
+    with _init_lock:
+        if DB_FILE not in _initialized_files:
+            with get_connection() as conn:
+                setup(conn)
+            _initialized_files.add(DB_FILE)
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from monitoring.metrics import get_counter
+
+# Number of sessions whose recent history is kept in memory
+MAX_CACHED_SESSIONS = 128
+
+# session_id -> {"messages": newest contiguous run of messages, "complete": run starts at the first message}
+_entries = OrderedDict()
+# session_id -> writes seen, so a read that raced a write-through does not store its older rows.
+# Kept for sessions that have left the cache as well, since a read can start before its entry goes.
+_versions = {}
+_epoch = 0  # Bumped when the whole cache is dropped
+_lock = threading.Lock()
+
+_hits = get_counter("history_cache_hits_total", "History reads served from the in-process cache")
+_misses = get_counter("history_cache_misses_total", "History reads that went to the database")
+
+def get_cached_history(session_id, limit=None, since_id=None):
+    # Returns the cached messages for a newest-anchored query, or None on a miss
+    with _lock:
+        entry = _entries.get(session_id)
+        messages = None
+        if entry is not None:
+            run = entry["messages"]
+            if since_id is not None:
+                covered = entry["complete"] or (run and run[0]["id"] <= since_id)
+                run = [m for m in run if m["id"] >= since_id]
+            elif limit is None:
+                covered = entry["complete"]
+            else:
+                covered = entry["complete"] or len(run) >= limit
+            if covered:
+                messages = list(run) if limit is None else run[max(len(run) - limit, 0):]
+                _entries.move_to_end(session_id)
+        (_hits if messages is not None else _misses).inc()
+        return messages
+
+def get_cached_has_earlier(session_id, before_id):
+    # Returns True/False when the cache can answer, None otherwise
+    with _lock:
+        entry = _entries.get(session_id)
+        if entry is None:
+            return None
+        run = entry["messages"]
+        if run and run[0]["id"] < before_id:
+            return True
+        return False if entry["complete"] else None
+
+def get_version(session_id):
+    # Taken before reading the history from the database, and handed back to store_history
+    with _lock:
+        return _epoch, _versions.get(session_id, 0)
+
+def _bump_version(session_id):
+    _versions[session_id] = _versions.get(session_id, 0) + 1
+
+def store_history(session_id, messages, complete, version=None):
+    with _lock:
+        if version is not None and version != (_epoch, _versions.get(session_id, 0)):
+            return  # A write landed since the read started; the rows may predate it
+        entry = _entries.get(session_id)
+        # Keep whichever run reaches further back
+        if entry is None or complete or len(messages) > len(entry["messages"]):
+            _entries[session_id] = {"messages": list(messages), "complete": complete}
+        _entries.move_to_end(session_id)
+        while len(_entries) > MAX_CACHED_SESSIONS:
+            _entries.popitem(last=False)
+
+def append_message(session_id, message):
+    # Write-through: a new message extends the cached run instead of invalidating it
+    with _lock:
+        _bump_version(session_id)
+        entry = _entries.get(session_id)
+        if entry is not None:
+            entry["messages"].append(message)
+
+def update_message(session_id, message_id, changes):
+    # Checkpoints of a streaming answer touch the newest messages, so the run is searched from the end
+    with _lock:
+        _bump_version(session_id)
+        entry = _entries.get(session_id)
+        if entry is not None:
+            run = entry["messages"]
+            for index in range(len(run) - 1, -1, -1):
+                if run[index]["id"] == message_id:
+                    # Replaced rather than updated, as earlier reads hand out the same dicts
+                    run[index] = {**run[index], **changes}
+                    break
+
+def seed_session(session_id):
+    store_history(session_id, [], complete=True)
+
+def invalidate(session_id=None):
+    global _epoch
+    with _lock:
+        if session_id is None:
+            _entries.clear()
+            _versions.clear()
+            _epoch += 1
+        else:
+            _entries.pop(session_id, None)
+            _bump_version(session_id)
@@ -0,0 +1,44 @@
+import threading
+from db.write_queue import submit_write
+
+# Pages released per step; small steps keep the writer free for message inserts
+VACUUM_PAGES_PER_STEP = 500
+
+_vacuum_running = False
+_vacuum_requested = False  # Set again by a delete while a run is under way, so its pages are not missed
+_vacuum_lock = threading.Lock()
+
+def _vacuum_step(conn):
+    # The sqlite3 module steps a row-less pragma only once, and each step of
+    # incremental_vacuum frees a single page, so free them one statement at a time.
+    # (Checked on SQLite 3.40: incremental_vacuum(500) frees one page, with or without fetchall().)
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    for _ in range(min(free_pages, VACUUM_PAGES_PER_STEP)):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+    return free_pages - min(free_pages, VACUUM_PAGES_PER_STEP)
+
+def _vacuum_until_done():
+    global _vacuum_running, _vacuum_requested
+    while True:
+        with _vacuum_lock:
+            if not _vacuum_requested:
+                _vacuum_running = False
+                return
+            _vacuum_requested = False
+        try:
+            while submit_write(_vacuum_step).result() > 0:
+                pass
+        except Exception:
+            pass  # Whatever is left is reclaimed after the next delete
+
+def schedule_incremental_vacuum():
+    # Reclaims free pages step by step on the background writer until none are left.
+    # Steps are queued from a thread of their own: resubmitting from a done-callback would run on
+    # the writer, which blocks on its own full queue.
+    global _vacuum_running, _vacuum_requested
+    with _vacuum_lock:
+        _vacuum_requested = True
+        if _vacuum_running:
+            return
+        _vacuum_running = True
+    threading.Thread(target=_vacuum_until_done, name="db-vacuum", daemon=True).start()
@@ -0,0 +1,290 @@
+import base64
+import json
+from db.attachments import create_attachments_table, store_attachment
+from db.response_cache import create_response_cache_table
+from db.model_stats import create_model_stats_table
+
+# region Migration Steps
+def _create_base_tables(conn):
+    # Original schema, kept as-is so databases created before versioning match it
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            created_at TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER,
+            role TEXT,
+            name TEXT,
+            content TEXT,
+            files TEXT,
+            timestamp TEXT,
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        )
+    """)
+    create_attachments_table(conn)
+
+def _add_indexes_and_constraints(conn):
+    # SQLite cannot add UNIQUE or ON DELETE CASCADE to existing tables, so both are rebuilt
+    conn.execute("""
+        CREATE TABLE sessions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            created_at TEXT
+        )
+    """)
+    taken_names = set()
+    for session_id, name, created_at in conn.execute("SELECT id, name, created_at FROM sessions ORDER BY id").fetchall():
+        # region Rename duplicated session names so they fit the UNIQUE constraint
+        unique_name = name
+        suffix = 2
+        while unique_name in taken_names:
+            unique_name = f"{name} ({suffix})"
+            suffix += 1
+        taken_names.add(unique_name)
+        # endregion
+        conn.execute(
+            "INSERT INTO sessions_new (id, name, created_at) VALUES (?, ?, ?)",
+            (session_id, unique_name, created_at)
+        )
+    conn.execute("""
+        CREATE TABLE messages_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            role TEXT,
+            name TEXT,
+            content TEXT,
+            files TEXT,
+            timestamp TEXT,
+            FOREIGN KEY(session_id) REFERENCES sessions(id) ON DELETE CASCADE
+        )
+    """)
+    # Orphaned messages would violate the enforced foreign key, so they are dropped
+    conn.execute("""
+        INSERT INTO messages_new (id, session_id, role, name, content, files, timestamp)
+        SELECT id, session_id, role, name, content, files, timestamp FROM messages
+        WHERE session_id IN (SELECT id FROM sessions_new)
+    """)
+    conn.execute("DROP TABLE messages")
+    conn.execute("DROP TABLE sessions")
+    conn.execute("ALTER TABLE sessions_new RENAME TO sessions")
+    conn.execute("ALTER TABLE messages_new RENAME TO messages")
+    conn.execute("CREATE INDEX idx_messages_session_id ON messages(session_id, id)")
+    conn.execute("CREATE INDEX idx_sessions_created_at ON sessions(created_at)")
+
+def _move_inline_files_to_attachments(conn):
+    # Rows saved before the attachment store carry base64 payloads inside messages.files
+    rows = conn.execute("SELECT id, files FROM messages WHERE files LIKE '%\"data\":%'").fetchall()
+    for message_id, files_json in rows:
+        files_metadata = []
+        for file in json.loads(files_json):
+            if "data" in file:
+                data = base64.b64decode(file["data"])
+                file = {
+                    "name": file.get("name"),
+                    "mimetype": file.get("mimetype"),
+                    "hash": store_attachment(conn, data, file.get("mimetype")),
+                    "size": len(data)
+                }
+            files_metadata.append(file)
+        conn.execute("UPDATE messages SET files=? WHERE id=?", (json.dumps(files_metadata), message_id))
+
+def _add_response_cache(conn):
+    create_response_cache_table(conn)
+
+def _add_message_search(conn):
+    # External-content FTS5 index over messages.content, kept in sync by triggers
+    conn.execute("""
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            content,
+            content='messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+def _add_session_metadata(conn):
+    # Per-session counters maintained by triggers, so the sidebar never aggregates messages
+    conn.execute("ALTER TABLE sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE sessions ADD COLUMN last_activity_at TEXT")
+    conn.execute("ALTER TABLE sessions ADD COLUMN title TEXT")
+    conn.execute("""
+        UPDATE sessions SET
+            message_count = (SELECT COUNT(*) FROM messages WHERE session_id = sessions.id),
+            last_activity_at = COALESCE(
+                (SELECT timestamp FROM messages WHERE session_id = sessions.id ORDER BY id DESC LIMIT 1),
+                created_at
+            ),
+            title = (
+                SELECT substr(content, 1, 80) FROM messages
+                WHERE session_id = sessions.id AND role = 'user' AND content <> ''
+                ORDER BY id LIMIT 1
+            )
+    """)
+    conn.execute("""
+        CREATE TRIGGER sessions_metadata_insert AFTER INSERT ON messages BEGIN
+            UPDATE sessions SET
+                message_count = message_count + 1,
+                last_activity_at = new.timestamp,
+                title = CASE
+                    WHEN title IS NULL AND new.role = 'user' AND new.content <> '' THEN substr(new.content, 1, 80)
+                    ELSE title
+                END
+            WHERE id = new.session_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER sessions_metadata_delete AFTER DELETE ON messages BEGIN
+            UPDATE sessions SET message_count = message_count - 1 WHERE id = old.session_id;
+        END
+    """)
+    conn.execute("CREATE INDEX idx_sessions_name_nocase ON sessions(name COLLATE NOCASE)")
+
+def _add_message_attachments(conn):
+    # Which messages reference which blobs, so unreferenced attachments can be found through an index
+    conn.execute("""
+        CREATE TABLE message_attachments (
+            message_id INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (message_id, hash),
+            FOREIGN KEY(message_id) REFERENCES messages(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_message_attachments_hash ON message_attachments(hash)")
+    conn.execute("""
+        INSERT OR IGNORE INTO message_attachments (message_id, hash)
+        SELECT messages.id, json_extract(file.value, '$.hash')
+        FROM messages, json_each(messages.files) AS file
+        WHERE messages.files IS NOT NULL AND json_extract(file.value, '$.hash') IS NOT NULL
+    """)
+
+def _add_user_scoping(conn):
+    # Sessions belong to a user; names only have to be unique per user, so the table is rebuilt.
+    # Existing sessions go to the default user ''.
+    conn.execute("""
+        CREATE TABLE sessions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL DEFAULT '',
+            name TEXT,
+            created_at TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_activity_at TEXT,
+            title TEXT,
+            UNIQUE (user_id, name)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO sessions_new (id, name, created_at, message_count, last_activity_at, title)
+        SELECT id, name, created_at, message_count, last_activity_at, title FROM sessions
+    """)
+    conn.execute("DROP TABLE sessions")
+    # The metadata triggers on messages name the sessions table; the legacy rename leaves them as they are
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    conn.execute("ALTER TABLE sessions_new RENAME TO sessions")
+    conn.execute("PRAGMA legacy_alter_table=OFF")
+    conn.execute("CREATE INDEX idx_sessions_user_created_at ON sessions(user_id, created_at)")
+    conn.execute("CREATE INDEX idx_sessions_user_name_nocase ON sessions(user_id, name COLLATE NOCASE)")
+
+def _add_model_stats(conn):
+    create_model_stats_table(conn)
+
+def _add_message_status(conn):
+    # Assistant answers are saved while they stream; every earlier message is complete.
+    # A streaming answer stays out of the search index until it ends: re-indexing the whole
+    # growing text made each checkpoint 30x slower than the update itself.
+    conn.execute("ALTER TABLE messages ADD COLUMN status TEXT NOT NULL DEFAULT 'complete'")
+    conn.execute("DROP TRIGGER messages_fts_insert")
+    conn.execute("DROP TRIGGER messages_fts_delete")
+    conn.execute("DROP TRIGGER messages_fts_update")
+    conn.execute("""
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages WHEN new.status <> 'streaming' BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages WHEN old.status <> 'streaming' BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, status ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) SELECT 'delete', old.id, old.content WHERE old.status <> 'streaming';
+            INSERT INTO messages_fts (rowid, content) SELECT new.id, new.content WHERE new.status <> 'streaming';
+        END
+    """)
+# endregion
+
+# Ordered list of (version, step); append new steps, never edit released ones
+MIGRATIONS = [
+    (1, _create_base_tables),
+    (2, _add_indexes_and_constraints),
+    (3, _move_inline_files_to_attachments),
+    (4, _add_response_cache),
+    (5, _add_message_search),
+    (6, _add_session_metadata),
+    (7, _add_message_attachments),
+    (8, _add_user_scoping),
+    (9, _add_model_stats),
+    (10, _add_message_status),
+]
+
+INCREMENTAL_AUTO_VACUUM = 2
+
+def get_schema_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT version FROM schema_version").fetchone()
+    return row[0] if row else 0
+
+def migrate(conn, target_version=None):
+    current_version = get_schema_version(conn)
+    for version, step in MIGRATIONS:
+        if version <= current_version:
+            continue
+        if target_version is not None and version > target_version:
+            break
+        # Table rebuilds need foreign keys off, and the pragma is ignored inside a transaction
+        conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute("DELETE FROM schema_version")
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("PRAGMA foreign_keys=ON")
+        current_version = version
+    _enable_incremental_vacuum(conn)
+    return current_version
+
+def _enable_incremental_vacuum(conn):
+    # Freed pages are then reclaimed in small background steps instead of a blocking VACUUM.
+    # Switching an existing file needs one full VACUUM, which cannot run inside a transaction.
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL_AUTO_VACUUM:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
@@ -0,0 +1,32 @@
+import json
+import time
+from db.connection import get_connection
+from db.write_queue import submit_write
+
+def create_model_stats_table(conn):
+    # Recent samples per OpenRouter model, so routing starts warm after a restart
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS model_stats (
+            model TEXT PRIMARY KEY,
+            latencies TEXT NOT NULL,
+            outcomes TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+
+def load_model_stats():
+    # {model: (latencies, outcomes)}: seconds to first token, and 1/0 per finished request
+    with get_connection() as conn:
+        return {
+            model: (json.loads(latencies), json.loads(outcomes))
+            for model, latencies, outcomes in conn.execute("SELECT model, latencies, outcomes FROM model_stats")
+        }
+
+def save_model_stats(model, latencies, outcomes):
+    latencies_json = json.dumps(list(latencies))
+    outcomes_json = json.dumps(list(outcomes))
+    now = time.time()
+    submit_write(lambda conn: conn.execute(
+        "INSERT OR REPLACE INTO model_stats (model, latencies, outcomes, updated_at) VALUES (?, ?, ?, ?)",
+        (model, latencies_json, outcomes_json, now)
+    ))
@@ -0,0 +1,385 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import Future
+from db.attachments import get_cached_attachment, cache_attachment
+from db.connection import run_once
+from db.response_cache import create_response_cache_table
+from db.model_stats import create_model_stats_table
+from db.storage import (
+    ChatStorage, StorageError, SESSION_COLUMNS, MESSAGE_COLUMNS, MESSAGE_STREAMING,
+    get_free_session_name, to_session, to_message, delete_orphan_attachments
+)
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+except ImportError:  # Only needed with CHAT_STORAGE_BACKEND=postgres
+    psycopg = ConnectionPool = None
+
+# region Settings (overridable through environment variables)
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://localhost/chat_history")
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))   # Per replica; keep replicas x max under max_connections
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))   # Seconds to wait for a free connection
+# endregion
+
+# Replicas starting together take this advisory lock, so only one of them creates the schema
+SCHEMA_LOCK_ID = 7_304_201
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL DEFAULT '',
+        name TEXT NOT NULL,
+        created_at TEXT,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        last_activity_at TEXT,
+        title TEXT,
+        UNIQUE (user_id, name)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sessions_user_created_at ON sessions(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_user_name_lower ON sessions(user_id, lower(name) text_pattern_ops)",
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id BIGSERIAL PRIMARY KEY,
+        session_id BIGINT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+        role TEXT,
+        name TEXT,
+        content TEXT,
+        files TEXT,
+        timestamp TEXT,
+        search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+    )
+    """,
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'complete'",
+    "CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_search ON messages USING GIN (search_vector)",
+    """
+    CREATE TABLE IF NOT EXISTS attachments (
+        hash TEXT PRIMARY KEY,
+        mimetype TEXT,
+        size INTEGER,
+        data BYTEA
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS message_attachments (
+        message_id BIGINT NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (message_id, hash)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_message_attachments_hash ON message_attachments(hash)",
+)
+
+def _to_tsquery(query):
+    # Every word must match, the last one as a prefix; tsquery operators never reach the parser
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return None
+    terms[-1] += ":*"
+    return " & ".join(terms)
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _create_local_tables(conn):
+    create_response_cache_table(conn)
+    create_model_stats_table(conn)
+
+class PostgresStorage(ChatStorage):
+    # Client/server backend for several app replicas: each process keeps a bounded
+    # connection pool, and every write commits in its own short transaction.
+
+    def __init__(self, conninfo=None, min_size=None, max_size=None, timeout=None):
+        if ConnectionPool is None:
+            raise RuntimeError("CHAT_STORAGE_BACKEND=postgres needs the psycopg and psycopg_pool packages")
+        self.pool = ConnectionPool(
+            conninfo or DATABASE_URL,
+            min_size=POOL_MIN_SIZE if min_size is None else min_size,
+            max_size=POOL_MAX_SIZE if max_size is None else max_size,
+            timeout=POOL_TIMEOUT if timeout is None else timeout,
+            open=True
+        )
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def init(self):
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            with self.pool.connection() as conn:
+                conn.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            # Cached responses and model latency stats stay in a replica-local SQLite file
+            run_once(_create_local_tables)
+            self._initialized = True
+
+    def close(self):
+        self.pool.close()
+
+    def create_session(self, user_id, name, timestamp):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "INSERT INTO sessions (user_id, name, created_at, last_activity_at) VALUES (%s, %s, %s, %s) RETURNING id",
+                (user_id, name, timestamp, timestamp)
+            ).fetchone()[0]
+
+    def get_sessions(self, user_id):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT id, name FROM sessions WHERE user_id=%s ORDER BY created_at DESC",
+                (user_id,)
+            ).fetchall()
+
+    def get_sessions_page(self, user_id, limit, offset, prefix):
+        # Newest sessions first; prefix filters names case-insensitively through the lower(name) index
+        query = f"SELECT {SESSION_COLUMNS} FROM sessions WHERE user_id=%s"
+        params = [user_id]
+        if prefix:
+            query += " AND lower(name) LIKE %s"
+            params.append(_escape_like(prefix.lower()) + "%")
+        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
+        params += [limit, offset]
+        with self.pool.connection() as conn:
+            return [to_session(row) for row in conn.execute(query, params).fetchall()]
+
+    def get_session(self, session_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {SESSION_COLUMNS} FROM sessions WHERE id=%s", (session_id,)).fetchone()
+        return to_session(row) if row else None
+
+    def has_sessions(self, user_id):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT EXISTS(SELECT 1 FROM sessions WHERE user_id=%s)", (user_id,)).fetchone()[0]
+
+    def session_name_exists(self, user_id, name):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM sessions WHERE user_id=%s AND name=%s)",
+                (user_id, name)
+            ).fetchone()[0]
+
+    def save_message(self, session_id, role, name, content, timestamp, files_metadata, attachments):
+        # Committed before returning; the future only keeps the interface shared with the queued SQLite writes
+        future = Future()
+        try:
+            future.set_result(self._insert_message(session_id, role, name, content, timestamp, files_metadata, attachments))
+        except psycopg.Error as ex:
+            future.set_exception(StorageError(str(ex)))
+        return future
+
+    def _insert_message(self, session_id, role, name, content, timestamp, files_metadata, attachments):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO attachments (hash, mimetype, size, data) VALUES (%s, %s, %s, %s) ON CONFLICT (hash) DO NOTHING",
+                [(digest, mimetype, len(data), data) for data, mimetype, digest in attachments]
+            )
+            message_id = cursor.execute(
+                "INSERT INTO messages (session_id, role, name, content, files, timestamp) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
+                (session_id, role, name, content, json.dumps(files_metadata) if files_metadata else None, timestamp)
+            ).fetchone()[0]
+            cursor.executemany(
+                "INSERT INTO message_attachments (message_id, hash) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                [(message_id, digest) for _, _, digest in attachments]
+            )
+            # Same bookkeeping as the SQLite metadata triggers
+            cursor.execute("""
+                UPDATE sessions SET
+                    message_count = message_count + 1,
+                    last_activity_at = %(timestamp)s,
+                    title = CASE
+                        WHEN title IS NULL AND %(role)s = 'user' AND %(content)s <> '' THEN substr(%(content)s, 1, 80)
+                        ELSE title
+                    END
+                WHERE id = %(session_id)s
+            """, {"timestamp": timestamp, "role": role, "content": content or "", "session_id": session_id})
+            return message_id
+
+    def start_message(self, session_id, role, name, timestamp):
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                message_id = cursor.execute(
+                    "INSERT INTO messages (session_id, role, name, content, timestamp, status) VALUES (%s, %s, %s, '', %s, %s) RETURNING id",
+                    (session_id, role, name, timestamp, MESSAGE_STREAMING)
+                ).fetchone()[0]
+                cursor.execute(
+                    "UPDATE sessions SET message_count = message_count + 1, last_activity_at = %s WHERE id = %s",
+                    (timestamp, session_id)
+                )
+                return message_id
+        except psycopg.Error as ex:
+            raise StorageError(str(ex)) from ex
+
+    def update_message(self, session_id, message_id, content, status):
+        # One short statement; callers throttle checkpoints, so there is nothing to coalesce here
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE messages SET content=%s, status=%s WHERE id=%s AND session_id=%s",
+                (content, status, message_id, session_id)
+            )
+
+    def fetch_chat_history(self, session_id, before_id, limit, since_id):
+        query = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id=%s"
+        params = [session_id]
+        if before_id is not None:
+            query += " AND id<%s"
+            params.append(before_id)
+        if since_id is not None:
+            query += " AND id>=%s"
+            params.append(since_id)
+        query += " ORDER BY id DESC LIMIT %s"
+        params.append(limit)  # None is LIMIT NULL, which is no limit
+        with self.pool.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        rows.reverse()
+        return [to_message(row) for row in rows]
+
+    def has_earlier_messages(self, session_id, before_id):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM messages WHERE session_id=%s AND id<%s)",
+                (session_id, before_id)
+            ).fetchone()[0]
+
+    def iter_session_messages(self, session_id):
+        # Server-side cursor, so long sessions are streamed instead of loaded at once
+        with self.pool.connection() as conn, conn.cursor(name=f"session_messages_{session_id}") as cursor:
+            cursor.execute(f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id=%s ORDER BY id", (session_id,))
+            for row in cursor:
+                yield to_message(row)
+
+    def iter_sessions(self, user_id):
+        query = f"SELECT {SESSION_COLUMNS} FROM sessions"
+        params = ()
+        if user_id is not None:
+            query += " WHERE user_id=%s"
+            params = (user_id,)
+        with self.pool.connection() as conn, conn.cursor(name="export_sessions") as cursor:
+            cursor.execute(query + " ORDER BY id", params)
+            for row in cursor:
+                yield to_session(row)
+
+    def import_batch(self, sessions, messages, session_ids):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            new_session_ids = {}
+            for key, user_id, name, created_at in sessions:
+                name = get_free_session_name(name, lambda candidate: cursor.execute(
+                    "SELECT EXISTS(SELECT 1 FROM sessions WHERE user_id=%s AND name=%s)",
+                    (user_id, candidate)
+                ).fetchone()[0])
+                new_session_ids[key] = cursor.execute(
+                    "INSERT INTO sessions (user_id, name, created_at, last_activity_at) VALUES (%s, %s, %s, %s) RETURNING id",
+                    (user_id, name, created_at, created_at)
+                ).fetchone()[0]
+            ids = {**session_ids, **new_session_ids}
+
+            # Message ids are drawn from the sequence up front, so attachment links can be inserted with executemany too
+            message_ids = [row[0] for row in cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, %s)",
+                (len(messages),)
+            ).fetchall()]
+            message_rows = []
+            attachment_rows = {}
+            link_rows = []
+            for message_id, (key, role, name, content, files_metadata, timestamp, status, attachments) in zip(message_ids, messages):
+                message_rows.append((message_id, ids[key], role, name, content, json.dumps(files_metadata) if files_metadata else None, timestamp, status))
+                for data, mimetype, digest in attachments:
+                    attachment_rows[digest] = (digest, mimetype, len(data), data)
+                    link_rows.append((message_id, digest))
+            cursor.executemany(
+                "INSERT INTO attachments (hash, mimetype, size, data) VALUES (%s, %s, %s, %s) ON CONFLICT (hash) DO NOTHING",
+                list(attachment_rows.values())
+            )
+            cursor.executemany(
+                "INSERT INTO messages (id, session_id, role, name, content, files, timestamp, status) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                message_rows
+            )
+            cursor.executemany(
+                "INSERT INTO message_attachments (message_id, hash) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                link_rows
+            )
+            # Metadata recomputed once per touched session instead of per message as in save_message
+            cursor.execute("""
+                UPDATE sessions s SET
+                    message_count = (SELECT count(*) FROM messages WHERE session_id = s.id),
+                    last_activity_at = COALESCE(
+                        (SELECT timestamp FROM messages WHERE session_id = s.id ORDER BY id DESC LIMIT 1),
+                        s.created_at
+                    ),
+                    title = COALESCE(s.title, (
+                        SELECT substr(content, 1, 80) FROM messages
+                        WHERE session_id = s.id AND role = 'user' AND content <> ''
+                        ORDER BY id LIMIT 1
+                    ))
+                WHERE s.id = ANY(%s)
+            """, (list({ids[message[0]] for message in messages}),))
+        session_ids.update(new_session_ids)
+
+    def search_messages(self, user_id, query, limit, offset):
+        # Newest matches first; snippets mark the matched words in bold markdown.
+        # Answers still streaming are left out, as SQLite keeps them out of its index.
+        tsquery = _to_tsquery(query)
+        if tsquery is None:
+            return []
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT m.session_id, s.name, m.id,
+                    ts_headline('simple', m.content, to_tsquery('simple', %s),
+                        'StartSel=**, StopSel=**, MaxWords=12, MinWords=4, FragmentDelimiter=…, MaxFragments=1')
+                FROM messages m
+                JOIN sessions s ON s.id = m.session_id
+                WHERE m.search_vector @@ to_tsquery('simple', %s) AND s.user_id = %s AND m.status <> %s
+                ORDER BY m.id DESC
+                LIMIT %s OFFSET %s
+            """, (tsquery, tsquery, user_id, MESSAGE_STREAMING, limit, offset)).fetchall()
+        return [
+            {
+                "session_id": sid,
+                "session_name": session_name,
+                "message_id": mid,
+                "snippet": snippet
+            }
+            for sid, session_name, mid, snippet in rows
+        ]
+
+    def fetch_attachment(self, digest):
+        data = get_cached_attachment(digest)
+        if data is not None:
+            return data
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT data FROM attachments WHERE hash=%s", (digest,)).fetchone()
+        if row is None:
+            return None
+        data = bytes(row[0])
+        cache_attachment(digest, data)
+        return data
+
+    def delete_session(self, user_id, session_id):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            # Messages and their attachment links go by ON DELETE CASCADE
+            hashes = [row[0] for row in cursor.execute(
+                "SELECT DISTINCT ma.hash FROM message_attachments ma "
+                "JOIN messages m ON m.id = ma.message_id WHERE m.session_id=%s",
+                (session_id,)
+            ).fetchall()]
+            cursor.execute("DELETE FROM sessions WHERE id=%s AND user_id=%s", (session_id, user_id))
+            delete_orphan_attachments(cursor, hashes, "%s")
+
+    def delete_all_sessions(self, user_id):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            hashes = [row[0] for row in cursor.execute(
+                "SELECT DISTINCT ma.hash FROM message_attachments ma "
+                "JOIN messages m ON m.id = ma.message_id "
+                "JOIN sessions s ON s.id = m.session_id WHERE s.user_id=%s",
+                (user_id,)
+            ).fetchall()]
+            cursor.execute("DELETE FROM sessions WHERE user_id=%s", (user_id,))
+            delete_orphan_attachments(cursor, hashes, "%s")
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+import time
+from db.connection import get_connection
+from db.write_queue import submit_write
+
+# region Settings (opt-in)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+# endregion
+
+def create_response_cache_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_used_at ON response_cache(last_used_at)")
+
+def get_response_cache_key(model, text, attachment_hashes, context_messages=()):
+    # context_messages are the earlier turns sent along with the prompt: the same question
+    # later in a conversation can need a different answer.
+    normalized_text = " ".join((text or "").split())
+    return hashlib.sha256(json.dumps([model, normalized_text, list(attachment_hashes), list(context_messages)]).encode()).hexdigest()
+
+def get_cached_response(key):
+    now = time.time()
+    with get_connection() as conn:
+        row = conn.execute("SELECT response, created_at FROM response_cache WHERE key=?", (key,)).fetchone()
+    if row is None:
+        return None
+    response, created_at = row
+    if now - created_at > RESPONSE_CACHE_TTL:
+        submit_write(lambda conn: conn.execute("DELETE FROM response_cache WHERE key=?", (key,)))
+        return None
+    submit_write(lambda conn: conn.execute("UPDATE response_cache SET last_used_at=? WHERE key=?", (now, key)))
+    return response
+
+def store_response(key, response):
+    now = time.time()
+
+    def insert_response(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+            (key, response, now, now)
+        )
+        # region Evict expired entries, then the least recently used beyond the size bound
+        conn.execute("DELETE FROM response_cache WHERE created_at < ?", (now - RESPONSE_CACHE_TTL,))
+        conn.execute("""
+            DELETE FROM response_cache WHERE key IN (
+                SELECT key FROM response_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (RESPONSE_CACHE_MAX_ENTRIES,))
+        # endregion
+
+    submit_write(insert_response)
@@ -0,0 +1,370 @@
+import json
+import sqlite3
+import threading
+from db.connection import get_connection, run_once
+from db.attachments import store_attachment, fetch_attachment
+from db.migrations import migrate
+from db import history_cache
+from db.storage import (
+    ChatStorage, StorageError, SESSION_COLUMNS, MESSAGE_COLUMNS, MESSAGE_STREAMING, MESSAGE_COMPLETE,
+    get_free_session_name, to_session, to_message, delete_orphan_attachments
+)
+from db.write_queue import submit_write, flush_writes
+from db.maintenance import schedule_incremental_vacuum
+
+# Per-row triggers that import_batch replaces with set-based statements
+_BULK_INSERT_TRIGGERS = ("messages_fts_insert", "sessions_metadata_insert")
+
+# message_id -> newest checkpointed content not yet written; one queued write per message picks it up
+_checkpoints = {}
+_checkpoints_lock = threading.Lock()
+
+def _refused_as_storage_error(write):
+    # The queued write fails its future with StorageError rather than the driver's exception
+    def run(conn):
+        try:
+            return write(conn)
+        except sqlite3.Error as ex:
+            raise StorageError(str(ex)) from ex
+    return run
+
+def _to_fts_query(query):
+    # Every word is matched literally (FTS5 operators are quoted away), the last one as a prefix
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+class SQLiteStorage(ChatStorage):
+    # Local database file: writes go through the single background writer and
+    # recent history is served from the in-process cache.
+
+    def init(self):
+        run_once(migrate)
+
+    def create_session(self, user_id, name, timestamp):
+        def insert_session(conn):
+            return conn.execute(
+                "INSERT INTO sessions (user_id, name, created_at, last_activity_at) VALUES (?, ?, ?, ?)",
+                (user_id, name, timestamp, timestamp)
+            ).lastrowid
+
+        session_id = submit_write(insert_session).result()
+        history_cache.seed_session(session_id)
+        return session_id
+
+    def get_sessions(self, user_id):
+        with get_connection() as conn:
+            return conn.execute(
+                "SELECT id, name FROM sessions WHERE user_id=? ORDER BY created_at DESC",
+                (user_id,)
+            ).fetchall()
+
+    def get_sessions_page(self, user_id, limit, offset, prefix):
+        # Newest sessions first; prefix filters names case-insensitively through an index range scan
+        query = f"SELECT {SESSION_COLUMNS} FROM sessions WHERE user_id=?"
+        params = [user_id]
+        if prefix:
+            query += " AND name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE"
+            params += [prefix, prefix + "\U0010ffff"]
+        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with get_connection() as conn:
+            return [to_session(row) for row in conn.execute(query, params).fetchall()]
+
+    def get_session(self, session_id):
+        with get_connection() as conn:
+            row = conn.execute(f"SELECT {SESSION_COLUMNS} FROM sessions WHERE id=?", (session_id,)).fetchone()
+        return to_session(row) if row else None
+
+    def has_sessions(self, user_id):
+        with get_connection() as conn:
+            return bool(conn.execute("SELECT EXISTS(SELECT 1 FROM sessions WHERE user_id=?)", (user_id,)).fetchone()[0])
+
+    def session_name_exists(self, user_id, name):
+        # Served by the UNIQUE index on sessions(user_id, name)
+        with get_connection() as conn:
+            return bool(conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM sessions WHERE user_id=? AND name=?)",
+                (user_id, name)
+            ).fetchone()[0])
+
+    def save_message(self, session_id, role, name, content, timestamp, files_metadata, attachments):
+        # Committed by the background writer; reads of this session wait for it
+        def insert_message(conn):
+            for data, mimetype, digest in attachments:
+                store_attachment(conn, data, mimetype, digest)
+            message_id = conn.execute(
+                "INSERT INTO messages (session_id, role, name, content, files, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, role, name, content, json.dumps(files_metadata) if files_metadata else None, timestamp)
+            ).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO message_attachments (message_id, hash) VALUES (?, ?)",
+                [(message_id, digest) for _, _, digest in attachments]
+            )
+            return message_id
+
+        def on_inserted(future):
+            if future.exception() is None:
+                history_cache.append_message(session_id, {
+                    "id": future.result(),
+                    "role": role,
+                    "name": name,
+                    "content": content,
+                    "files": files_metadata,
+                    "timestamp": timestamp,
+                    "status": MESSAGE_COMPLETE
+                })
+
+        future = submit_write(_refused_as_storage_error(insert_message), key=session_id)
+        future.add_done_callback(on_inserted)
+        return future
+
+    def start_message(self, session_id, role, name, timestamp):
+        def insert_message(conn):
+            return conn.execute(
+                "INSERT INTO messages (session_id, role, name, content, timestamp, status) VALUES (?, ?, ?, '', ?, ?)",
+                (session_id, role, name, timestamp, MESSAGE_STREAMING)
+            ).lastrowid
+
+        def on_inserted(future):
+            if future.exception() is None:
+                history_cache.append_message(session_id, {
+                    "id": future.result(),
+                    "role": role,
+                    "name": name,
+                    "content": "",
+                    "files": [],
+                    "timestamp": timestamp,
+                    "status": MESSAGE_STREAMING
+                })
+
+        future = submit_write(_refused_as_storage_error(insert_message), key=session_id)
+        future.add_done_callback(on_inserted)
+        return future.result()
+
+    def update_message(self, session_id, message_id, content, status):
+        # Checkpoints are coalesced: while one is queued, newer text replaces its content instead of queuing another.
+        # The final update supersedes any checkpoint still waiting.
+        def write_content(conn, content, status):
+            conn.execute("UPDATE messages SET content=?, status=? WHERE id=? AND session_id=?", (content, status, message_id, session_id))
+            return {"content": content, "status": status}
+
+        def write_checkpoint(conn):
+            with _checkpoints_lock:
+                content = _checkpoints.pop(message_id, None)
+            return write_content(conn, content, MESSAGE_STREAMING) if content is not None else None
+
+        def on_written(future):
+            if future.exception() is None and future.result() is not None:
+                history_cache.update_message(session_id, message_id, future.result())
+
+        with _checkpoints_lock:
+            if status == MESSAGE_STREAMING:
+                queued = message_id in _checkpoints
+                _checkpoints[message_id] = content
+                if queued:
+                    return
+            else:
+                _checkpoints.pop(message_id, None)
+        if status == MESSAGE_STREAMING:
+            future = submit_write(write_checkpoint, key=session_id)
+        else:
+            future = submit_write(lambda conn: write_content(conn, content, status), key=session_id)
+        future.add_done_callback(on_written)
+
+    def fetch_chat_history(self, session_id, before_id, limit, since_id):
+        flush_writes(session_id)
+        if before_id is None:
+            cached = history_cache.get_cached_history(session_id, limit, since_id)
+            if cached is not None:
+                return cached
+        version = history_cache.get_version(session_id)
+        query = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id=?"
+        params = [session_id]
+        if before_id is not None:
+            query += " AND id<?"
+            params.append(before_id)
+        if since_id is not None:
+            query += " AND id>=?"
+            params.append(since_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(-1 if limit is None else limit)
+        with get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        rows.reverse()
+        messages = [to_message(row) for row in rows]
+        if before_id is None:
+            # A short page, or an unbounded one, reaches back to the first message
+            complete = since_id is None and (limit is None or len(messages) < limit)
+            history_cache.store_history(session_id, messages, complete, version)
+        return messages
+
+    def has_earlier_messages(self, session_id, before_id):
+        flush_writes(session_id)
+        cached = history_cache.get_cached_has_earlier(session_id, before_id)
+        if cached is not None:
+            return cached
+        with get_connection() as conn:
+            row = conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM messages WHERE session_id=? AND id<?)",
+                (session_id, before_id)
+            ).fetchone()
+        return bool(row[0])
+
+    def iter_session_messages(self, session_id):
+        flush_writes(session_id)
+        with get_connection() as conn:  # Held until the generator is exhausted or closed
+            cursor = conn.execute(
+                f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id=? ORDER BY id",
+                (session_id,)
+            )
+            for row in cursor:
+                yield to_message(row)
+
+    def iter_sessions(self, user_id):
+        flush_writes()
+        query = f"SELECT {SESSION_COLUMNS} FROM sessions"
+        params = ()
+        if user_id is not None:
+            query += " WHERE user_id=?"
+            params = (user_id,)
+        with get_connection() as conn:
+            for row in conn.execute(query + " ORDER BY id", params):
+                yield to_session(row)
+
+    def import_batch(self, sessions, messages, session_ids):
+        # One queued write, so the whole batch shares a transaction; the metadata and search triggers run per row
+        def insert_batch(conn):
+            new_session_ids = {}
+            for key, user_id, name, created_at in sessions:
+                name = get_free_session_name(name, lambda candidate: conn.execute(
+                    "SELECT EXISTS(SELECT 1 FROM sessions WHERE user_id=? AND name=?)",
+                    (user_id, candidate)
+                ).fetchone()[0])
+                new_session_ids[key] = conn.execute(
+                    "INSERT INTO sessions (user_id, name, created_at, last_activity_at) VALUES (?, ?, ?, ?)",
+                    (user_id, name, created_at, created_at)
+                ).lastrowid
+            ids = {**session_ids, **new_session_ids}
+
+            # Message ids are handed out up front, so attachment links can be inserted with executemany too
+            first_id = conn.execute("""
+                SELECT MAX(
+                    COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'messages'), 0),
+                    COALESCE((SELECT MAX(id) FROM messages), 0)
+                ) + 1
+            """).fetchone()[0]
+            message_rows = []
+            attachment_rows = {}
+            link_rows = []
+            for message_id, (key, role, name, content, files_metadata, timestamp, status, attachments) in enumerate(messages, first_id):
+                message_rows.append((message_id, ids[key], role, name, content, json.dumps(files_metadata) if files_metadata else None, timestamp, status))
+                for data, mimetype, digest in attachments:
+                    attachment_rows[digest] = (digest, mimetype, len(data), data)
+                    link_rows.append((message_id, digest))
+            conn.executemany(
+                "INSERT OR IGNORE INTO attachments (hash, mimetype, size, data) VALUES (?, ?, ?, ?)",
+                attachment_rows.values()
+            )
+            # region Insert without the per-row triggers, then index and count in bulk
+            # Dropping them inside the transaction hides nothing from readers, and a failed batch rolls the drop back
+            triggers = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?)",
+                _BULK_INSERT_TRIGGERS
+            ).fetchall()
+            for trigger_name, _ in triggers:
+                conn.execute(f"DROP TRIGGER {trigger_name}")
+            conn.executemany(
+                "INSERT INTO messages (id, session_id, role, name, content, files, timestamp, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                message_rows
+            )
+            if message_rows:
+                last_id = first_id + len(message_rows) - 1
+                # Streaming answers stay out of the index, as with the insert trigger
+                conn.execute(
+                    "INSERT INTO messages_fts (rowid, content) SELECT id, content FROM messages WHERE id BETWEEN ? AND ? AND status <> ?",
+                    (first_id, last_id, MESSAGE_STREAMING)
+                )
+                conn.executemany("""
+                    UPDATE sessions SET
+                        message_count = message_count + (SELECT COUNT(*) FROM messages WHERE session_id = sessions.id AND id BETWEEN :first AND :last),
+                        last_activity_at = COALESCE(
+                            (SELECT timestamp FROM messages WHERE session_id = sessions.id AND id BETWEEN :first AND :last ORDER BY id DESC LIMIT 1),
+                            last_activity_at
+                        ),
+                        title = COALESCE(title, (
+                            SELECT substr(content, 1, 80) FROM messages
+                            WHERE session_id = sessions.id AND role = 'user' AND content <> ''
+                            ORDER BY id LIMIT 1
+                        ))
+                    WHERE id = :session_id
+                """, [
+                    {"first": first_id, "last": last_id, "session_id": session_id}
+                    for session_id in {row[1] for row in message_rows}
+                ])
+            for _, trigger_sql in triggers:
+                conn.execute(trigger_sql)
+            # endregion
+            conn.executemany("INSERT OR IGNORE INTO message_attachments (message_id, hash) VALUES (?, ?)", link_rows)
+            return new_session_ids
+
+        session_ids.update(submit_write(insert_batch).result())
+
+    def search_messages(self, user_id, query, limit, offset):
+        # Newest matches first; snippets mark the matched words in bold markdown
+        fts_query = _to_fts_query(query)
+        if not fts_query:
+            return []
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT m.session_id, s.name, m.id, snippet(messages_fts, 0, '**', '**', '…', 12)
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN sessions s ON s.id = m.session_id
+                WHERE messages_fts MATCH ? AND s.user_id = ?
+                ORDER BY messages_fts.rowid DESC
+                LIMIT ? OFFSET ?
+            """, (fts_query, user_id, limit, offset)).fetchall()
+            return [
+                {
+                    "session_id": sid,
+                    "session_name": session_name,
+                    "message_id": mid,
+                    "snippet": snippet
+                }
+                for sid, session_name, mid, snippet in rows
+            ]
+
+    def fetch_attachment(self, digest):
+        return fetch_attachment(digest)
+
+    def delete_session(self, user_id, session_id):
+        def delete_rows(conn):
+            # Messages and their attachment links go by ON DELETE CASCADE
+            hashes = [row[0] for row in conn.execute(
+                "SELECT DISTINCT message_attachments.hash FROM message_attachments "
+                "JOIN messages ON messages.id = message_attachments.message_id WHERE messages.session_id=?",
+                (session_id,)
+            )]
+            conn.execute("DELETE FROM sessions WHERE id=? AND user_id=?", (session_id, user_id))
+            delete_orphan_attachments(conn, hashes, "?")
+
+        submit_write(delete_rows, key=session_id).result()
+        history_cache.invalidate(session_id)
+        schedule_incremental_vacuum()
+
+    def delete_all_sessions(self, user_id):
+        def delete_all(conn):
+            hashes = [row[0] for row in conn.execute(
+                "SELECT DISTINCT message_attachments.hash FROM message_attachments "
+                "JOIN messages ON messages.id = message_attachments.message_id "
+                "JOIN sessions ON sessions.id = messages.session_id WHERE sessions.user_id=?",
+                (user_id,)
+            )]
+            conn.execute("DELETE FROM sessions WHERE user_id=?", (user_id,))
+            delete_orphan_attachments(conn, hashes, "?")
+
+        submit_write(delete_all).result()
+        history_cache.invalidate()
+        schedule_incremental_vacuum()
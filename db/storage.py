@@ -0,0 +1,131 @@
+import json
+
+# Message status: assistant answers are created as "streaming" and checkpointed until they end
+MESSAGE_STREAMING = "streaming"
+MESSAGE_COMPLETE = "complete"
+MESSAGE_FAILED = "failed"
+
+class StorageError(Exception):
+    # A write the database refused, e.g. a message for a session deleted from another tab
+    pass
+
+def get_free_session_name(name, name_exists):
+    # name, or "name (2)", "name (3)", ... for the first one name_exists(candidate) rejects
+    candidate = name
+    suffix = 2
+    while name_exists(candidate):
+        candidate = f"{name} ({suffix})"
+        suffix += 1
+    return candidate
+
+# Column lists read by to_session and to_message, in the order they unpack them
+SESSION_COLUMNS = "id, user_id, name, title, message_count, last_activity_at, created_at"
+MESSAGE_COLUMNS = "id, role, name, content, files, timestamp, status"
+
+def to_session(row):
+    sid, user_id, name, title, message_count, last_activity_at, created_at = row
+    return {
+        "id": sid,
+        "user_id": user_id,
+        "name": name,
+        "title": title,
+        "message_count": message_count,
+        "last_activity_at": last_activity_at,
+        "created_at": created_at
+    }
+
+def to_message(row):
+    i, r, n, c, f, t, status = row
+    return {
+        "id": i,
+        "role": r,
+        "name": n,
+        "content": c,
+        "files": json.loads(f) if f else [],
+        "timestamp": t,
+        "status": status
+    }
+
+def delete_orphan_attachments(cursor, hashes, placeholder):
+    # Blobs still referenced by another message are kept; placeholder is the driver's, "?" or "%s"
+    cursor.executemany(
+        f"DELETE FROM attachments WHERE hash={placeholder} "
+        f"AND NOT EXISTS (SELECT 1 FROM message_attachments WHERE hash={placeholder})",
+        [(digest, digest) for digest in hashes]
+    )
+
+class ChatStorage:
+    # Interface implemented by every storage backend. Sessions belong to a user_id;
+    # messages and attachments are reached through their session.
+    #
+    # Session dicts have id, user_id, name, title, message_count, last_activity_at, created_at.
+    # Message dicts have id, role, name, content, files, timestamp, status, oldest first.
+
+    def init(self):
+        # Creates or migrates the schema; called on every script run, so it must be cheap after the first
+        raise NotImplementedError
+
+    def create_session(self, user_id, name, timestamp):
+        raise NotImplementedError
+
+    def get_sessions(self, user_id):
+        # [(id, name)], newest first
+        raise NotImplementedError
+
+    def get_sessions_page(self, user_id, limit, offset, prefix):
+        raise NotImplementedError
+
+    def get_session(self, session_id):
+        raise NotImplementedError
+
+    def has_sessions(self, user_id):
+        raise NotImplementedError
+
+    def session_name_exists(self, user_id, name):
+        raise NotImplementedError
+
+    def save_message(self, session_id, role, name, content, timestamp, files_metadata, attachments):
+        # attachments: [(data, mimetype, hash)]; files_metadata is stored with the message.
+        # Returns a Future of the message id, failed with StorageError when the write is refused.
+        raise NotImplementedError
+
+    def start_message(self, session_id, role, name, timestamp):
+        # Creates an empty message with MESSAGE_STREAMING status and returns its id; raises StorageError when refused
+        raise NotImplementedError
+
+    def update_message(self, session_id, message_id, content, status):
+        # Replaces the content; called repeatedly while streaming, so it must not block on the database for long
+        raise NotImplementedError
+
+    def fetch_chat_history(self, session_id, before_id, limit, since_id):
+        raise NotImplementedError
+
+    def has_earlier_messages(self, session_id, before_id):
+        raise NotImplementedError
+
+    def iter_session_messages(self, session_id):
+        # Every message of the session, streamed oldest first
+        raise NotImplementedError
+
+    def iter_sessions(self, user_id):
+        # Every session of the user, or of all users when user_id is None, streamed oldest first
+        raise NotImplementedError
+
+    def import_batch(self, sessions, messages, session_ids):
+        # Bulk insert committed as one transaction.
+        # sessions: [(key, user_id, name, created_at)], renamed "name (2)", ... when the user already has the name.
+        # messages: [(session_key, role, name, content, files_metadata, timestamp, status, attachments)].
+        # session_ids maps the keys of earlier batches to session ids and is extended with this batch's sessions.
+        raise NotImplementedError
+
+    def search_messages(self, user_id, query, limit, offset):
+        raise NotImplementedError
+
+    def fetch_attachment(self, digest):
+        raise NotImplementedError
+
+    def delete_session(self, user_id, session_id):
+        raise NotImplementedError
+
+    def delete_all_sessions(self, user_id):
+        raise NotImplementedError
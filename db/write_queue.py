@@ -0,0 +1,116 @@
+import atexit
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from db.connection import get_connection
+from monitoring.metrics import get_histogram
+
+# region Settings
+WRITE_QUEUE_SIZE = 1000   # Producers block once this many writes are waiting
+BATCH_SIZE = 100          # Writes committed together in one transaction
+FLUSH_INTERVAL = 0.01     # Seconds a batch waits for more writes before committing
+# endregion
+
+_batch_seconds = get_histogram("db_write_batch_seconds", "Time to run and commit one batch of queued writes")
+_batch_size = get_histogram("db_write_batch_size", "Writes committed per batch", buckets=(1, 2, 5, 10, 25, 50, 100))
+
+_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+_pending = Counter()
+_pending_changed = threading.Condition()
+_writer = None
+_writer_lock = threading.Lock()
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="db-writer", daemon=True)
+                _writer.start()
+
+def submit_write(write, key=None):
+    # Queues write(conn) for the single writer thread and returns a Future of its result.
+    # Writes run in submission order, so ordering within a session is preserved.
+    _ensure_writer()
+    future = Future()
+    with _pending_changed:
+        _pending[key] += 1
+    _queue.put((write, key, future))
+    return future
+
+def flush_writes(key=None, timeout=None):
+    # Waits until queued writes for key (or all writes when key is None) are committed
+    with _pending_changed:
+        return _pending_changed.wait_for(
+            lambda: (_pending[key] if key is not None else sum(_pending.values())) == 0,
+            timeout
+        )
+
+def _run_batch(conn, batch):
+    # Returns (future, result, error) per write
+    outcomes = []
+    try:
+        conn.execute("BEGIN")
+        for write, _, future in batch:
+            # A failing write is rolled back on its own without losing the rest of the batch
+            conn.execute("SAVEPOINT queued_write")
+            try:
+                outcomes.append((future, write(conn), None))
+                conn.execute("RELEASE queued_write")
+            except Exception as ex:
+                conn.execute("ROLLBACK TO queued_write")
+                conn.execute("RELEASE queued_write")
+                outcomes.append((future, None, ex))
+        conn.commit()
+    except Exception as ex:
+        if conn.in_transaction:
+            conn.rollback()
+        outcomes = [(future, None, ex) for _, _, future in batch]
+    return outcomes
+
+def _commit_batch(batch):
+    _batch_size.observe(len(batch))
+    with _batch_seconds.time(), get_connection() as conn:
+        outcomes = _run_batch(conn, batch)
+
+    # Results are published only after the commit, so readers never see uncommitted rows
+    for future, result, error in outcomes:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+    with _pending_changed:
+        for _, key, _ in batch:
+            _pending[key] -= 1
+            if not _pending[key]:
+                del _pending[key]
+        _pending_changed.notify_all()
+
+def _write_loop():
+    running = True
+    while running:
+        item = _queue.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            try:
+                item = _queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+        _commit_batch(batch)
+
+def shutdown(timeout=5):
+    # Commits whatever is still queued, then stops the writer
+    if _writer is not None and _writer.is_alive():
+        _queue.put(None)
+        _writer.join(timeout)
+
+atexit.register(shutdown)
@@ -0,0 +1,231 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# region Settings (overridable through environment variables)
+METRICS_ENABLED = os.environ.get("CHAT_METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_HOST = os.environ.get("CHAT_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("CHAT_METRICS_PORT", 0))                    # Prometheus text on /metrics; 0 disables
+METRICS_LOG_INTERVAL = float(os.environ.get("CHAT_METRICS_LOG_INTERVAL", 0))  # Seconds between JSON log lines; 0 disables
+METRICS_DEBUG_PANEL = os.environ.get("CHAT_METRICS_DEBUG_PANEL", "false").lower() in ("1", "true", "yes")
+# endregion
+
+# Upper bounds in seconds, from a cached query up to a long generation
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1_000)
+
+_metrics = {}
+_registry_lock = threading.Lock()
+_exporters_started = False
+
+class Counter:
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.value += amount
+
+    def get_snapshot(self):
+        return {"count": self.value}
+
+class Gauge(Counter):
+    # A value that goes up and down, such as a queue depth
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.value = value
+
+    def get_snapshot(self):
+        return {"value": self.value}
+
+class Histogram:
+    def __init__(self, name, description, labels, buckets=TIME_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        # Context manager observing the elapsed seconds; a shared no-op when metrics are off
+        return _Timer(self) if METRICS_ENABLED else _NULL_TIMER
+
+    def get_quantile(self, quantile):
+        # Upper bound of the bucket holding the quantile, as Prometheus' histogram_quantile approximates
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def get_snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.get_quantile(0.5),
+            "p95": self.get_quantile(0.95),
+        }
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+_NULL_TIMER = nullcontext()
+
+def _get_metric(metric_class, name, description, labels, **options):
+    key = (name, tuple(sorted((labels or {}).items())))
+    metric = _metrics.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = _metrics.get(key)
+            if metric is None:
+                metric = metric_class(name, description, key[1], **options)
+                _metrics[key] = metric
+    return metric
+
+def get_counter(name, description, labels=None):
+    return _get_metric(Counter, name, description, labels)
+
+def get_gauge(name, description, labels=None):
+    return _get_metric(Gauge, name, description, labels)
+
+def get_histogram(name, description, labels=None, buckets=TIME_BUCKETS):
+    return _get_metric(Histogram, name, description, labels, buckets=buckets)
+
+def timed(name, description, labels=None):
+    # Decorator timing every call into a histogram. Returns the function itself
+    # when metrics are off, so disabled instrumentation costs nothing per call.
+    def decorator(function):
+        if not METRICS_ENABLED:
+            return function
+        histogram = get_histogram(name, description, labels)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(histogram):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+# region Export
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+def render_prometheus():
+    # Prometheus text exposition format, version 0.0.4
+    lines = []
+    described = set()
+    for (name, _), metric in sorted(_metrics.items(), key=lambda item: item[0]):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {metric.description}")
+            metric_type = "gauge" if isinstance(metric, Gauge) else "counter" if isinstance(metric, Counter) else "histogram"
+            lines.append(f"# TYPE {name} {metric_type}")
+        if isinstance(metric, Counter):
+            lines.append(f"{name}{_format_labels(metric.labels)} {metric.value}")
+            continue
+        cumulative = 0
+        for bound, bucket_count in zip(list(metric.buckets) + ["+Inf"], metric.bucket_counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(metric.labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(metric.labels)} {metric.sum}")
+        lines.append(f"{name}_count{_format_labels(metric.labels)} {metric.count}")
+    return "\n".join(lines) + "\n"
+
+def get_snapshot():
+    # {"name{label=value}": {count, sum, mean, p50, p95}} for the JSON log and the debug panel
+    return {
+        f"{name}{_format_labels(labels)}": metric.get_snapshot()
+        for (name, labels), metric in sorted(_metrics.items(), key=lambda item: item[0])
+    }
+
+def _start_metrics_server(host, port):
+    # http.server is only imported when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+
+def _log_snapshots(interval):
+    while True:
+        time.sleep(interval)
+        print(json.dumps({"time": time.time(), "metrics": get_snapshot()}), flush=True)
+
+def start_exporters():
+    # Starts the /metrics endpoint and the periodic JSON log once per process, as configured
+    global _exporters_started
+    if not METRICS_ENABLED or _exporters_started:
+        return
+    with _registry_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if METRICS_PORT:
+        _start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if METRICS_LOG_INTERVAL:
+        threading.Thread(target=_log_snapshots, args=(METRICS_LOG_INTERVAL,), name="metrics-log", daemon=True).start()
+# endregion
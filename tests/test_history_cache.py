@@ -0,0 +1,60 @@
+# A history read that races a write must not leave its older rows in the cache
+import pytest
+from db import connection, history_cache
+from db.storage import MESSAGE_STREAMING, MESSAGE_COMPLETE
+from db.write_queue import flush_writes
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(connection, "DB_FILE", str(tmp_path / "chat_history.db"))
+    from db.sqlite_storage import SQLiteStorage
+    backend = SQLiteStorage()
+    backend.init()
+    yield backend
+    flush_writes()
+    history_cache.invalidate()
+    connection.close_connections()
+
+def save(storage, session_id, role, content):
+    return storage.save_message(session_id, role, role, content, "2024-01-01T10:00:00", [], []).result()
+
+def write_between_read_and_store(monkeypatch, write):
+    # The write commits after the read's SELECT and before its rows reach the cache
+    store_history = history_cache.store_history
+    def store_after_write(*args, **kwargs):
+        monkeypatch.setattr(history_cache, "store_history", store_history)
+        write()
+        store_history(*args, **kwargs)
+    monkeypatch.setattr(history_cache, "store_history", store_after_write)
+
+def test_read_racing_a_new_message(storage, monkeypatch):
+    session_id = storage.create_session("", "Chat", "2024-01-01T10:00:00")
+    save(storage, session_id, "user", "First question")
+    history_cache.invalidate(session_id)
+
+    def save_answer():
+        save(storage, session_id, "assistant", "First answer")
+        flush_writes(session_id)
+    write_between_read_and_store(monkeypatch, save_answer)
+
+    raced = storage.fetch_chat_history(session_id, None, 50, None)
+    assert [message["content"] for message in raced] == ["First question"]
+    history = storage.fetch_chat_history(session_id, None, 50, None)
+    assert [message["content"] for message in history] == ["First question", "First answer"]
+
+def test_read_racing_a_checkpoint(storage, monkeypatch):
+    session_id = storage.create_session("", "Chat", "2024-01-01T10:00:00")
+    message_id = storage.start_message(session_id, "assistant", "assistant", "2024-01-01T10:00:00")
+    storage.update_message(session_id, message_id, "Partial", MESSAGE_STREAMING)
+    flush_writes(session_id)
+    history_cache.invalidate(session_id)
+
+    def finish_answer():
+        storage.update_message(session_id, message_id, "Partial answer, finished", MESSAGE_COMPLETE)
+        flush_writes(session_id)
+    write_between_read_and_store(monkeypatch, finish_answer)
+
+    raced = storage.fetch_chat_history(session_id, None, 50, None)
+    assert (raced[-1]["content"], raced[-1]["status"]) == ("Partial", MESSAGE_STREAMING)
+    message = storage.fetch_chat_history(session_id, None, 50, None)[-1]
+    assert (message["content"], message["status"]) == ("Partial answer, finished", MESSAGE_COMPLETE)
@@ -0,0 +1,140 @@
+# The storage contract every backend keeps. SQLite always runs; Postgres runs against the
+# test database in CHAT_POSTGRES_DSN, e.g. postgresql://postgres@localhost/chat_test
+import os
+import uuid
+import pytest
+from db import connection, history_cache
+from db.storage import StorageError, MESSAGE_STREAMING, MESSAGE_COMPLETE
+
+POSTGRES_DSN = os.environ.get("CHAT_POSTGRES_DSN")
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def storage(request, tmp_path, monkeypatch):
+    # Both backends keep their local tables (response cache, model stats) in the SQLite file
+    monkeypatch.setattr(connection, "DB_FILE", str(tmp_path / "chat_history.db"))
+    if request.param == "sqlite":
+        from db.sqlite_storage import SQLiteStorage
+        from db.write_queue import flush_writes
+        backend = SQLiteStorage()
+        backend.init()
+        yield backend
+        flush_writes()
+        history_cache.invalidate()
+        connection.close_connections()
+    else:
+        if not POSTGRES_DSN:
+            pytest.skip("CHAT_POSTGRES_DSN is not set")
+        from db.postgres_storage import PostgresStorage
+        backend = PostgresStorage(conninfo=POSTGRES_DSN, min_size=1, max_size=4)
+        backend.init()
+        yield backend
+        backend.close()
+        connection.close_connections()
+
+@pytest.fixture
+def user_id(storage):
+    # Every test works in its own user, so a shared Postgres database needs no truncating
+    user_id = f"test-{uuid.uuid4().hex}"
+    yield user_id
+    storage.delete_all_sessions(user_id)
+
+def save(storage, session_id, role, content, attachments=(), timestamp="2024-01-01T10:00:00"):
+    files_metadata = [
+        {"name": f"file{index}", "mimetype": mimetype, "hash": digest, "size": len(data)}
+        for index, (data, mimetype, digest) in enumerate(attachments)
+    ]
+    return storage.save_message(session_id, role, "user" if role == "user" else "openai/gpt-4.1", content, timestamp, files_metadata, list(attachments)).result()
+
+def unique_attachment():
+    data = uuid.uuid4().bytes
+    return data, "application/octet-stream", uuid.uuid4().hex
+
+def test_sessions(storage, user_id):
+    first = storage.create_session(user_id, "Project notes", "2024-01-01T10:00:00")
+    second = storage.create_session(user_id, "Recipes", "2024-01-02T10:00:00")
+
+    assert [tuple(row) for row in storage.get_sessions(user_id)] == [(second, "Recipes"), (first, "Project notes")]
+    assert storage.has_sessions(user_id)
+    assert storage.session_name_exists(user_id, "Recipes")
+    assert not storage.session_name_exists(user_id, "Other")
+    assert not storage.has_sessions(f"{user_id}-other")
+    assert [session["id"] for session in storage.get_sessions_page(user_id, 10, 0, "proj")] == [first]
+    session = storage.get_session(first)
+    assert (session["user_id"], session["name"], session["message_count"]) == (user_id, "Project notes", 0)
+
+def test_saved_message_is_read_back(storage, user_id):
+    session_id = storage.create_session(user_id, "Chat", "2024-01-01T10:00:00")
+    attachment = unique_attachment()
+    user_message_id = save(storage, session_id, "user", "What is in this file?", [attachment])
+    answer_id = save(storage, session_id, "assistant", "Random bytes.", timestamp="2024-01-01T10:00:05")
+
+    history = storage.fetch_chat_history(session_id, None, 50, None)
+    assert [(message["id"], message["role"], message["content"], message["status"]) for message in history] == [
+        (user_message_id, "user", "What is in this file?", MESSAGE_COMPLETE),
+        (answer_id, "assistant", "Random bytes.", MESSAGE_COMPLETE)
+    ]
+    assert [file["hash"] for file in history[0]["files"]] == [attachment[2]]
+    assert storage.fetch_attachment(attachment[2]) == attachment[0]
+    assert storage.fetch_chat_history(session_id, answer_id, 50, None)[-1]["id"] == user_message_id
+    assert storage.has_earlier_messages(session_id, answer_id)
+    assert [message["id"] for message in storage.iter_session_messages(session_id)] == [user_message_id, answer_id]
+    session = storage.get_session(session_id)
+    assert (session["message_count"], session["title"], session["last_activity_at"]) == (2, "What is in this file?", "2024-01-01T10:00:05")
+
+def test_streaming_message_is_searchable_once_finished(storage, user_id):
+    session_id = storage.create_session(user_id, "Chat", "2024-01-01T10:00:00")
+    message_id = storage.start_message(session_id, "assistant", "openai/gpt-4.1", "2024-01-01T10:00:00")
+    storage.update_message(session_id, message_id, "Photosynthesis turns light", MESSAGE_STREAMING)
+
+    assert storage.fetch_chat_history(session_id, None, 50, None)[-1]["status"] == MESSAGE_STREAMING
+    assert storage.search_messages(user_id, "photosynthesis", 20, 0) == []
+
+    storage.update_message(session_id, message_id, "Photosynthesis turns light into sugar.", MESSAGE_COMPLETE)
+    message = storage.fetch_chat_history(session_id, None, 50, None)[-1]
+    assert (message["content"], message["status"]) == ("Photosynthesis turns light into sugar.", MESSAGE_COMPLETE)
+    assert [result["message_id"] for result in storage.search_messages(user_id, "photosynth", 20, 0)] == [message_id]
+    assert storage.search_messages(f"{user_id}-other", "photosynthesis", 20, 0) == []
+
+def test_writes_to_a_deleted_session_are_refused(storage, user_id):
+    session_id = storage.create_session(user_id, "Chat", "2024-01-01T10:00:00")
+    storage.delete_session(user_id, session_id)
+
+    with pytest.raises(StorageError):
+        save(storage, session_id, "user", "Anyone there?")
+    with pytest.raises(StorageError):
+        storage.start_message(session_id, "assistant", "openai/gpt-4.1", "2024-01-01T10:00:00")
+    assert storage.get_session(session_id) is None
+
+def test_deleting_a_session_keeps_attachments_shared_with_another(storage, user_id):
+    kept = storage.create_session(user_id, "Kept", "2024-01-01T10:00:00")
+    deleted = storage.create_session(user_id, "Deleted", "2024-01-01T10:00:00")
+    shared = unique_attachment()
+    orphaned = unique_attachment()
+    save(storage, kept, "user", "Shared file", [shared])
+    save(storage, deleted, "user", "Both files", [shared, orphaned])
+
+    storage.delete_session(user_id, deleted)
+
+    assert storage.fetch_attachment(orphaned[2]) is None
+    assert storage.fetch_attachment(shared[2]) == shared[0]
+    assert [tuple(row) for row in storage.get_sessions(user_id)] == [(kept, "Kept")]
+
+def test_import_batch(storage, user_id):
+    storage.create_session(user_id, "Imported", "2024-01-01T10:00:00")
+    attachment = unique_attachment()
+    session_ids = {}
+    storage.import_batch(
+        [("a", user_id, "Imported", "2024-01-02T10:00:00")],
+        [
+            ("a", "user", "user", "Imported question", [], "2024-01-02T10:00:00", MESSAGE_COMPLETE, [attachment]),
+            ("a", "assistant", "openai/gpt-4.1", "Imported answer", [], "2024-01-02T10:00:01", MESSAGE_COMPLETE, [])
+        ],
+        session_ids
+    )
+
+    session = storage.get_session(session_ids["a"])
+    assert (session["name"], session["message_count"], session["title"]) == ("Imported (2)", 2, "Imported question")
+    history = storage.fetch_chat_history(session_ids["a"], None, 50, None)
+    assert [message["content"] for message in history] == ["Imported question", "Imported answer"]
+    assert storage.fetch_attachment(attachment[2]) == attachment[0]
+    assert [result["session_id"] for result in storage.search_messages(user_id, "imported answer", 20, 0)] == [session_ids["a"]]